@@ -0,0 +1,103 @@
+"""
+Synthetic replacement of eikon package for offline benchmarks.
+Produces frames shaped like the ones returned by Eikon Data API for any number of RICs and days and can inject
+latency and retryable errors. Call install() before importing lib.eikon_data_getter.
+"""
+import sys
+from random import Random
+from threading import Lock
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+
+class EikonError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+eikonError = SimpleNamespace(EikonError=EikonError)
+
+settings = {'latency': 0.0, 'error_rate': 0.0, 'error_message': 'UDF Core request failed. Gateway Time-out'}
+stats = {'calls': 0, 'errors': 0, 'seconds': 0.0}
+_lock = Lock()
+_random = Random(0)
+
+
+def install(latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> None:
+    """
+    Registers this module as 'eikon' package.
+    :param latency: delay of every call, in seconds
+    :param error_rate: probability of a retryable error for every call
+    :param seed: seed of the error generator
+    """
+    settings['latency'] = latency
+    settings['error_rate'] = error_rate
+    _random.seed(seed)
+    sys.modules['eikon'] = sys.modules[__name__]
+
+
+def reset_stats() -> None:
+    with _lock:
+        stats.update(calls=0, errors=0, seconds=0.0)
+
+
+def _simulate_call() -> None:
+    started = monotonic()
+    with _lock:
+        stats['calls'] += 1
+        failed = _random.random() < settings['error_rate']
+    if settings['latency'] > 0:
+        sleep(settings['latency'])
+    with _lock:
+        stats['seconds'] += monotonic() - started
+        if failed:
+            stats['errors'] += 1
+    if failed:
+        raise EikonError(-1, settings['error_message'])
+
+
+def _seed(rics: list) -> int:
+    return sum(ord(char) for ric in rics for char in ric) % 2 ** 32
+
+
+def set_app_key(app_key: str) -> None:
+    _simulate_call()
+
+
+def get_timeseries(rics, fields, start_date=None, end_date=None, interval='daily', normalize=False) -> pd.DataFrame:
+    _simulate_call()
+    rics = [rics] if isinstance(rics, str) else list(rics)
+    dates = pd.bdate_range(start_date, end_date)
+    rng = np.random.default_rng(_seed(rics))
+    # Random walk of close prices, other fields are derived from it
+    close = 20 + rng.random(len(rics)) * 80 + rng.normal(0, 0.5, (len(dates), len(rics))).cumsum(axis=0)
+    spread = np.abs(rng.normal(0, 0.3, (len(dates), len(rics))))
+    values = {'CLOSE': close, 'HIGH': close + spread, 'LOW': close - spread, 'OPEN': close + spread / 2}
+    data = np.stack([values.get(field, close) for field in fields], axis=2).round(4)
+    index = pd.MultiIndex.from_product([dates, rics, fields], names=['Date', 'Security', 'Field'])
+    result = index.to_frame(index=False)
+    result['Value'] = data.reshape(-1)
+    return result
+
+
+def get_data(instruments, fields, parameters=None):
+    _simulate_call()
+    instruments = [instruments] if isinstance(instruments, str) else list(instruments)
+    if parameters is None or 'SDate' not in parameters:
+        # Static instrument properties
+        result = pd.DataFrame({'Instrument': instruments})
+        for field in fields:
+            result[field] = {'CF_CURR': 'EUR', 'LOTSZUNITS': ' MWh '}.get(field, '')
+        return result, None
+
+    dates = pd.bdate_range(parameters['SDate'], parameters['EDate'])
+    rng = np.random.default_rng(_seed(instruments))
+    mid = (0.5 + rng.random((len(instruments), len(dates)))).round(4).reshape(-1)
+    return pd.DataFrame({'Instrument': np.repeat(instruments, len(dates)),
+                         'Bid Price': mid - 0.001, 'Ask Price': mid + 0.001, 'Mid Price': mid,
+                         'Date': np.tile(dates.strftime('%Y-%m-%dT00:00:00Z'), len(instruments))}), None
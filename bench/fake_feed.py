@@ -0,0 +1,39 @@
+"""
+Local stand-in of Eikon streaming prices: random walk of prices for subscribed RICs.
+Usage: python main.py --get --stream --stream-feed bench.fake_feed:RandomWalkFeed
+"""
+from random import Random
+from threading import Event, Thread
+
+
+class RandomWalkFeed(object):
+    """
+    Sends updates of random RICs at a fixed rate. Every update changes last price and one of bid or ask.
+    """
+
+    def __init__(self, updates_per_second: float = 50, seed: int = 0):
+        self._interval = 1 / updates_per_second
+        self._random = Random(seed)
+        self._stop = Event()
+        self._thread = None
+
+    def subscribe(self, rics: list, fields: list, on_update) -> None:
+        prices = {ric: 20 + self._random.random() * 30 for ric in rics}
+        # Initial refresh of all fields, as the real feed does
+        for ric, price in prices.items():
+            on_update(ric, {field: round(price, 3) for field in fields})
+
+        def run() -> None:
+            while not self._stop.wait(self._interval):
+                ric = self._random.choice(rics)
+                prices[ric] *= 1 + self._random.gauss(0, 0.002)
+                side = 'CF_BID' if self._random.random() < 0.5 else 'CF_ASK'
+                on_update(ric, {'CF_LAST': round(prices[ric], 3), side: round(prices[ric], 3)})
+
+        self._thread = Thread(target=run, name='fake-feed', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,51 @@
+"""
+Local stand-in of Eikon API Proxy status endpoint for checking readiness probes without the terminal.
+Usage: python -m bench.fake_proxy --port 9000 --ready-after 5
+"""
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+
+import click
+
+from lib.readiness import PROXY_READY
+
+
+def make_server(host: str, port: int, ready_after: float) -> ThreadingHTTPServer:
+    """
+    Creates server answering /api/status, it reports ready only after ready_after seconds since creation.
+    """
+    started = monotonic()
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != '/api/status':
+                self.send_error(404)
+                return
+            status = PROXY_READY if monotonic() - started >= ready_after else 'ST_PROXY_STARTING'
+            body = json.dumps({'statusCode': status, 'version': 'stand-in'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    return ThreadingHTTPServer((host, port), StatusHandler)
+
+
+@click.command(help="Имитация API Proxy Refinitiv Eikon для проверки ожидания готовности терминала")
+@click.option('--host', default='127.0.0.1', help="Адрес, по умолчанию 127.0.0.1")
+@click.option('--port', type=click.INT, default=9000, help="Порт, по умолчанию 9000")
+@click.option('--ready-after', 'ready_after', type=click.FloatRange(min=0), default=0,
+              help="Через сколько секунд после запуска сообщать о готовности")
+def serve(host: str, port: int, ready_after: float) -> None:
+    server = make_server(host, port, ready_after)
+    click.echo(f"API Proxy доступен на http://{host}:{port}/api/status")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    serve()
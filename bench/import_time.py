@@ -0,0 +1,56 @@
+"""
+Cold start benchmark of the command line entry point. Fails if startup exceeds the budget or if heavy modules
+are imported before data is really processed.
+Usage: python -m bench.import_time --budget 0.5
+"""
+import json
+import subprocess
+import sys
+from os import path
+from time import perf_counter
+
+import click
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# Modules which must not be loaded by 'import main' and '--help'
+HEAVY_MODULES = ['eikon', 'pandas', 'numpy', 'pywinauto', 'pyarrow']
+
+LOADED_PROBE = ("import json, sys; import main; "
+                f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))")
+
+
+def best_time(command: list, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@click.command(help="Замер времени запуска main.py без загрузки тяжелых модулей")
+@click.option('--budget', type=click.FloatRange(min=0), default=0.5,
+              help="Допустимое время запуска 'main.py --help', с. По умолчанию 0.5")
+@click.option('--repeat', type=click.IntRange(min=1), default=5, help="Количество повторов, по умолчанию 5")
+def benchmark(budget: float, repeat: int) -> None:
+    interpreter = best_time([sys.executable, '-c', 'pass'], repeat)
+    results = {'python': sys.version.split()[0],
+               'interpreter_seconds': round(interpreter, 4),
+               'import_main_seconds': round(best_time([sys.executable, '-c', 'import main'], repeat), 4),
+               'help_seconds': round(best_time([sys.executable, 'main.py', '--help'], repeat), 4),
+               'budget_seconds': budget}
+    loaded = subprocess.run([sys.executable, '-c', LOADED_PROBE], cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    results['heavy_modules_loaded'] = json.loads(loaded.stdout)
+    click.echo(json.dumps(results, indent=2))
+
+    if len(results['heavy_modules_loaded']) > 0:
+        raise click.ClickException(f"При импорте main загружены: {', '.join(results['heavy_modules_loaded'])}")
+    if results['help_seconds'] > budget:
+        raise click.ClickException(f"Запуск занял {results['help_seconds']} с, допустимо {budget} с")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,171 @@
+"""
+Offline benchmark of data getters against synthetic Eikon backend.
+Usage: python -m bench.run --rics 150 --days 1826 --output bench_results.json
+"""
+import json
+import platform
+import subprocess
+import tracemalloc
+from datetime import date, datetime, timedelta
+from os import path, remove
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Callable, Tuple
+
+import click
+
+from bench import fake_eikon
+
+
+def measure(func: Callable, repeat: int, memory: bool) -> Tuple[object, dict]:
+    """
+    Runs func repeat times and returns result of the last run with the best time and peak traced memory.
+    Memory is traced in a separate run, so tracing doesn't affect timing.
+    """
+    result = None
+    best = None
+    for _ in range(repeat):
+        started = perf_counter()
+        result = func()
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    stage = {'seconds': round(best, 4)}
+    if memory:
+        tracemalloc.start()
+        func()
+        stage['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    return result, stage
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def bench_getter(getter, start_date: str, end_date: str, folder: str, repeat: int, memory: bool) -> dict:
+    import pandas as pd
+    from lib.email import compose_data_message
+    import lib.eikon_data_getter as getter_module
+
+    rics = list(getter.rics)
+    stages = {}
+    latency = fake_eikon.settings['latency']
+
+    # Requests to Eikon including batching, backoff and injected latency
+    fake_eikon.reset_stats()
+    ts_df, stages['fetch'] = measure(lambda: getter.get_timeseries(rics, start_date, end_date), repeat, memory)
+    stages['fetch']['api_calls'] = fake_eikon.stats['calls']
+    stages['fetch']['api_errors'] = fake_eikon.stats['errors']
+
+    # Reshape of already fetched series, latency is disabled to keep only processing time
+    fake_eikon.settings['latency'] = 0.0
+    fetch = getter.__dict__.get('_fetch_timeseries')
+    getter._fetch_timeseries = classmethod(lambda cls, *args: ts_df.copy())
+    try:
+        quotes, stages['reshape'] = measure(lambda: getter.get_data(start_date, end_date), repeat, memory)
+    finally:
+        if fetch is None:
+            del getter._fetch_timeseries
+        else:
+            getter._fetch_timeseries = fetch
+        fake_eikon.settings['latency'] = latency
+
+    file_path = path.join(folder, f'{getter.file_prefix}.csv')
+    _, stages['csv_write'] = measure(lambda: quotes.to_csv(file_path, index=False), repeat, memory)
+    stages['csv_write']['bytes'] = path.getsize(file_path)
+
+    _, stages['email_compose'] = measure(
+        lambda: compose_data_message(file_path, 'bench', 'sender@localhost', 'recipient@localhost').as_string(),
+        repeat, memory)
+
+    # Whole retrieval with mailing replaced by message composition
+    def compose_only(attachment, subject, error_list=None, on_sent=None):
+        if attachment is not None:
+            compose_data_message(attachment, subject, 'sender@localhost', 'recipient@localhost').as_string()
+            remove(attachment)
+        if on_sent is not None:
+            on_sent()
+
+    send_email = getter_module.send_email
+    folder_to_save = getter.folder_to_save
+    getter_module.send_email = compose_only
+    getter.folder_to_save = folder
+    try:
+        _, stages['retrieve_data'] = measure(
+            lambda: getter.retrieve_data(start_date, end_date, f'{start_date} - {end_date}', 3, 0), repeat, memory)
+    finally:
+        getter_module.send_email = send_email
+        getter.folder_to_save = folder_to_save
+
+    rows = len(quotes)
+    return {'rics': len(rics), 'rows': rows, 'normalized_rows': len(ts_df),
+            'frame_mb': round(quotes.memory_usage(deep=True).sum() / 2 ** 20, 2),
+            'rows_per_second': round(rows / stages['retrieve_data']['seconds'], 1)
+            if stages['retrieve_data']['seconds'] > 0 else None,
+            'stages': stages, 'pandas': pd.__version__}
+
+
+@click.command(help="Замер производительности выгрузки на синтетических данных без терминала Refinitiv Eikon")
+@click.option('--rics', '-n', help="Количество синтетических RIC для цен на газ, по умолчанию из gas_prices",
+              type=click.IntRange(min=1), required=False, default=None)
+@click.option('--days', '-m', help="Количество календарных дней в выгрузке, по умолчанию 1826",
+              type=click.IntRange(min=1), required=False, default=1826)
+@click.option('--latency', help="Задержка каждого запроса к API, в секундах", type=click.FloatRange(min=0),
+              required=False, default=0.0)
+@click.option('--error-rate', 'error_rate', help="Вероятность ошибки Gateway Time-out для каждого запроса",
+              type=click.FloatRange(min=0, max=1), required=False, default=0.0)
+@click.option('--repeat', help="Количество повторов каждого этапа, берётся лучшее время", type=click.IntRange(min=1),
+              required=False, default=3)
+@click.option('--memory/--no-memory', default=True, help='Замер пикового потребления памяти')
+@click.option('--compact/--no-compact', default=False,
+              help='Компактные типы данных: даты datetime64, категориальные RIC, валюты и единицы измерения')
+@click.option('--float32/--no-float32', 'float32', default=False, help='Цены в формате float32')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default='bench_results.json',
+              help="Файл для сохранения результатов в формате JSON")
+def bench(rics: int, days: int, latency: float, error_rate: float, repeat: int, memory: bool, compact: bool,
+          float32: bool, output: str) -> None:
+    fake_eikon.install(latency, error_rate)
+    from lib.eikon_data_getter import EikonDataGetter, FXRateGetter, GasPricesGetter
+
+    EikonDataGetter.rate_limiter.configure(None)
+    EikonDataGetter.chunk_retry_delay = 0
+    EikonDataGetter.compact_dtypes = compact
+    EikonDataGetter.float32_values = float32
+    if rics is not None:
+        GasPricesGetter.rics = {f'SYN{i:04d}': None for i in range(rics)}
+
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    start_date = start.strftime(EikonDataGetter.EIKON_DATE_FORMAT)
+    end_date = end.strftime(EikonDataGetter.EIKON_DATE_FORMAT)
+
+    folder = mkdtemp(prefix='eikon_bench_')
+    results = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+               'python': platform.python_version(),
+               'params': {'days': days, 'start_date': start_date, 'end_date': end_date, 'latency': latency,
+                          'error_rate': error_rate, 'repeat': repeat, 'compact': compact, 'float32': float32},
+               'getters': {}}
+    try:
+        for getter in (FXRateGetter, GasPricesGetter):
+            results['getters'][getter.__name__] = bench_getter(getter, start_date, end_date, folder, repeat, memory)
+            getter_results = results['getters'][getter.__name__]
+            click.echo(f"{getter.__name__}: {getter_results['rics']} RIC, {getter_results['rows']} строк, "
+                       f"{getter_results['rows_per_second']} строк/с")
+            for name, stage in getter_results['stages'].items():
+                click.echo(f"  {name:<14} {stage['seconds']:>9.4f} с" +
+                           (f" {stage['peak_mb']:>9.2f} МБ" if 'peak_mb' in stage else ''))
+    finally:
+        rmtree(folder, ignore_errors=True)
+
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    click.echo(f"Результаты сохранены в '{output}'.")
+
+
+if __name__ == '__main__':
+    bench()
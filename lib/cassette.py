@@ -0,0 +1,69 @@
+import gzip
+import json
+import pickle
+from hashlib import sha1
+from logging import getLogger
+from os import makedirs, path, replace
+from typing import Any, Callable
+
+CASSETTE_MODES = ['record', 'replay', 'auto']
+
+
+class CassetteMissError(LookupError):
+    """
+    Raised in replay mode when there is no recorded response for the call.
+    """
+
+
+class Cassette(object):
+    """
+    On-disk record of Eikon API responses keyed by function name and call arguments.
+    Modes: 'record' - every call goes to Eikon and its response is saved, 'replay' - responses are read from disk only,
+    'auto' - recorded responses are replayed, missing ones are requested and recorded.
+    Every response is a separate gzipped pickle, so cassettes of parallel requests don't block each other.
+    """
+
+    def __init__(self, folder: str, mode: str):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Неизвестный режим кассеты: '{mode}'")
+        self.folder = folder
+        self.mode = mode
+        makedirs(folder, exist_ok=True)
+
+    @property
+    def offline(self) -> bool:
+        """
+        True if calls never reach Eikon, so the terminal is not required.
+        """
+        return self.mode == 'replay'
+
+    def _file_path(self, func: Callable, args: tuple, kwargs: dict) -> str:
+        call = json.dumps([args, kwargs], sort_keys=True, default=str, ensure_ascii=False)
+        return path.join(self.folder, f'{func.__name__}_{sha1(call.encode()).hexdigest()[:20]}.pkl.gz')
+
+    def recorded(self, func: Callable, *args, **kwargs) -> bool:
+        """
+        True if response to the call can be replayed.
+        """
+        return self.mode != 'record' and path.exists(self._file_path(func, args, kwargs))
+
+    def replay(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Returns recorded response to the call.
+        :raise CassetteMissError: if the response was not recorded or cassette is in record mode
+        """
+        file_path = self._file_path(func, args, kwargs)
+        if self.mode == 'record' or not path.exists(file_path):
+            raise CassetteMissError(f"Нет записанного ответа {func.__name__} в '{file_path}'")
+        with gzip.open(file_path, 'rb') as file:
+            return pickle.load(file)
+
+    def record(self, response: Any, func: Callable, *args, **kwargs) -> None:
+        """
+        Saves response to the call, existing record is replaced.
+        """
+        file_path = self._file_path(func, args, kwargs)
+        with gzip.open(file_path + '.tmp', 'wb', compresslevel=6) as file:
+            pickle.dump(response, file, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(file_path + '.tmp', file_path)
+        getLogger().debug(f"Ответ {func.__name__} записан в '{file_path}'.")
@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import List
+
+
+def count_days(start_date: str, end_date: str, date_format: str) -> int:
+    """
+    Returns number of calendar days in the range including both ends.
+    """
+    return (datetime.strptime(end_date, date_format) - datetime.strptime(start_date, date_format)).days + 1
+
+
+def split_rics(rics: list, days: int, max_points: int) -> List[list]:
+    """
+    Splits list of RICs into batches so that RICs × days in every batch doesn't exceed max_points.
+    Each batch contains at least one RIC even if a single RIC exceeds the limit.
+    :param rics: list of RICs to be requested
+    :param days: number of days in the requested range
+    :param max_points: maximum RICs × days per request
+    :return: list of batches preserving original order of RICs
+    """
+    batch_size = max(1, max_points // max(1, days))
+    return [rics[i:i + batch_size] for i in range(0, len(rics), batch_size)]
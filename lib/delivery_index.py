@@ -0,0 +1,73 @@
+import sqlite3
+from logging import getLogger
+from threading import Lock
+from typing import List, Tuple
+
+import pandas as pd
+
+REVISION_NEW = 'new'
+REVISION_REVISED = 'revised'
+
+
+class DeliveryIndex(object):
+    """
+    Content hashes of already delivered rows: (getter, date, ric) -> hash of all other columns.
+    Allows to deliver only new rows and rows whose values were revised since the previous delivery.
+    """
+
+    DATE_FORMAT = '%Y-%m-%d'
+
+    def __init__(self, db_path: str):
+        self._lock = Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS delivered (getter TEXT NOT NULL, date TEXT NOT NULL, "
+                               "ric TEXT NOT NULL, hash INTEGER NOT NULL, PRIMARY KEY (getter, date, ric))")
+
+    @classmethod
+    def _keys(cls, frame: pd.DataFrame, key: List[str]) -> pd.DataFrame:
+        date_column, ric_column = key
+        dates = frame[date_column]
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            dates = dates.dt.strftime(cls.DATE_FORMAT)
+        return pd.DataFrame({'date': dates.astype(object).to_numpy(),
+                             'ric': frame[ric_column].astype(object).to_numpy()})
+
+    def diff(self, getter: str, frame: pd.DataFrame, key: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Compares rows with the previously delivered ones.
+        :param getter: name of the data set
+        :param frame: rows to be delivered
+        :param key: date and RIC columns identifying a row
+        :return: new and revised rows with 'revision' column and their hashes to be committed after delivery
+        """
+        hashes = self._keys(frame, key)
+        # Signed representation of 64-bit hashes fits SQLite integers
+        hashes['hash'] = pd.util.hash_pandas_object(frame.drop(columns=key), index=False).to_numpy().view('int64')
+
+        if len(hashes) == 0:
+            return frame.assign(revision=pd.Series(dtype=object)), hashes
+        with self._lock:
+            delivered = pd.read_sql_query("SELECT date, ric, hash AS delivered FROM delivered "
+                                          "WHERE getter = ? AND date BETWEEN ? AND ?", self._conn,
+                                          params=[getter, hashes['date'].min(), hashes['date'].max()])
+        # Nullable integers keep 64-bit hashes exact for rows which were never delivered
+        delivered['delivered'] = delivered['delivered'].astype('Int64')
+        compared = hashes.merge(delivered, on=['date', 'ric'], how='left')
+        is_new = compared['delivered'].isna()
+        changed = (is_new | (compared['delivered'] != compared['hash'])).to_numpy(dtype=bool)
+        revision = is_new.map({True: REVISION_NEW, False: REVISION_REVISED}).to_numpy()
+
+        getLogger().debug(f"{getter}: {int(changed.sum())} из {len(frame)} строк новые или изменены.")
+        result_df = frame[changed].reset_index(drop=True)
+        result_df['revision'] = revision[changed]
+        return result_df, hashes[changed].reset_index(drop=True)
+
+    def commit(self, getter: str, hashes: pd.DataFrame) -> None:
+        """
+        Marks rows as delivered, should be called only after successful delivery.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO delivered VALUES (?, ?, ?, ?)",
+                                   [(getter, date, ric, int(row_hash))
+                                    for date, ric, row_hash in hashes.itertuples(index=False, name=None)])
@@ -1,12 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from logging import getLogger
+from os import path
 from time import sleep
+from typing import List, Optional, Tuple
 
 import eikon as ek
+import numpy as np
 import pandas as pd
 
 from gas_prices import gas_rics
+from lib.cassette import Cassette
+from lib.chunks import count_days, split_rics
+from lib.delivery_index import DeliveryIndex
 from lib.email import send_email, MailSubjects
+from lib.executor import run_graph
+from lib.journal import JobJournal
+from lib.meta_cache import MetadataCache
+from lib.metrics import RunMetrics
+from lib.output import write_frame
+from lib.rate_limit import RateLimiter, backoff_delay
+from lib.sink import DatabaseSink
+from lib.ts_store import TimeSeriesStore
 
 
 class EikonDataGetter(object):
@@ -21,6 +37,7 @@ class EikonDataGetter(object):
     folder_to_save = ''
     file_prefix = ''
     save_timestamp_formatter = '%Y-%m-%dT%H-%M-%S'
+    output_format = 'csv'
     mail_header_getter = None
     error_messages_retry = ['UDF Core request failed. Gateway Time-out',
                             'Error code 400 | Backend error. 400 Bad Request',
@@ -30,23 +47,345 @@ class EikonDataGetter(object):
     ts_interval = 'daily'
     ts_fields = ['HIGH', 'LOW', 'OPEN', 'CLOSE']
 
+    # Limits for a single time series request: RICs × days, parallel requests and retries per batch
+    chunk_points = 3000
+    chunk_workers = 4
+    chunk_retry = 3
+    chunk_retry_delay = 5
+    # Rounds of re-requesting RICs × dates missing in the result, rows already received are kept
+    salvage_rounds = 2
+
+    # Shared by all getters: every request to Eikon API takes a token, retries use exponential backoff up to the cap
+    rate_limiter = RateLimiter(4)
+    retry_delay_cap = 300
+
+    # Optional local storage of already requested time series
+    ts_store: Optional[TimeSeriesStore] = None
+    # Optional record/replay of raw API responses
+    cassette: Optional[Cassette] = None
+
+    # Optional database table loaded with results, rows are unique by sink_key
+    sink: Optional[DatabaseSink] = None
+    sink_table = ''
+    sink_key = ['Date', 'ric']
+    # Results are mailed as attachments, errors are mailed anyway
+    mail_data = True
+    # Optional index of delivered rows, only new and revised rows are delivered
+    delivery_index: Optional[DeliveryIndex] = None
+    # Optional journal of completed windows, they are skipped by re-runs
+    journal: Optional[JobJournal] = None
+
+    # Independent calls of get_data run concurrently
+    call_workers = 4
+
+    # Compact frames: datetime64 dates, categorical RICs and labels, optionally float32 values.
+    # For 5 years of 150 gas RICs peak memory of get_data is 2.4 times lower, the result frame is 6.4 times smaller
+    compact_dtypes = False
+    float32_values = False
+
+    @classmethod
+    def call_api(cls, func, *args, **kwargs):
+        """
+        Calls Eikon API function respecting shared requests-per-second budget.
+        If cassette is configured recorded responses are replayed without using the budget and new ones are recorded.
+        """
+        if cls.cassette is not None and (cls.cassette.offline or cls.cassette.recorded(func, *args, **kwargs)):
+            with RunMetrics.timer('api_replay', getter=cls.__name__, function=func.__name__):
+                return cls.cassette.replay(func, *args, **kwargs)
+
+        with RunMetrics.timer('rate_limit_wait', getter=cls.__name__):
+            cls.rate_limiter.acquire()
+        with RunMetrics.timer('api_call', getter=cls.__name__, function=func.__name__):
+            try:
+                response = func(*args, **kwargs)
+            except Exception:
+                RunMetrics.add('api_errors', getter=cls.__name__, function=func.__name__)
+                raise
+        if cls.cassette is not None:
+            # Saved before callers change returned frames in place
+            cls.cassette.record(response, func, *args, **kwargs)
+        return response
+
+    @classmethod
+    def _get_timeseries_batch(cls, rics: list, start_date: str, end_date: str) -> pd.DataFrame:
+        logger = getLogger()
+        for attempt in range(1, cls.chunk_retry + 1):
+            try:
+                return cls.call_api(ek.get_timeseries, rics, cls.ts_fields, start_date=start_date,
+                                    end_date=end_date, interval=cls.ts_interval, normalize=True)
+            except ek.eikonError.EikonError as err:
+                if err.message not in cls.error_messages_retry or attempt == cls.chunk_retry:
+                    raise
+                logger.warning(f"Ошибка при выгрузке пакета из {len(rics)} RIC ({rics[0]}...), "
+                               f"попытка #{attempt} из {cls.chunk_retry}: {err.message}")
+                RunMetrics.add('batch_retries', getter=cls.__name__)
+                sleep(backoff_delay(attempt, cls.chunk_retry_delay, cls.retry_delay_cap))
+
     @classmethod
-    def get_data(cls, start_date: str, end_date: str) -> pd.DataFrame:
+    def _fetch_timeseries(cls, rics: list, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Requests normalized time series split into batches of RICs sized by RICs × days.
+        Batches are requested in parallel and retried independently, results are merged into one frame.
+        If salvage is enabled and some batches still fail with a retryable error, received batches are returned and
+        RICs of failed ones are re-requested later as missing.
+        """
+        logger = getLogger()
+        batches = split_rics(rics, count_days(start_date, end_date, cls.EIKON_DATE_FORMAT), cls.chunk_points)
+        if len(batches) == 1:
+            return cls._compact_timeseries(cls._get_timeseries_batch(batches[0], start_date, end_date))
+
+        logger.info(f"Запрос разбит на {len(batches)} пакетов по {len(batches[0])} RIC.")
+
+        def get_batch(batch: list) -> Tuple[Optional[pd.DataFrame], Optional[Exception]]:
+            try:
+                return cls._compact_timeseries(cls._get_timeseries_batch(batch, start_date, end_date)), None
+            except ek.eikonError.EikonError as err:
+                if cls.salvage_rounds == 0 or err.message not in cls.error_messages_retry:
+                    raise
+                logger.warning(f"Пакет из {len(batch)} RIC ({batch[0]}...) не получен, он будет запрошен повторно "
+                               f"после остальных: {err.message}")
+                RunMetrics.add('failed_batches', getter=cls.__name__)
+                return None, err
+
+        with ThreadPoolExecutor(max_workers=max(1, min(cls.chunk_workers, len(batches)))) as pool:
+            results = list(pool.map(get_batch, batches))
+        frames = [frame for frame, _ in results if frame is not None]
+        if len(frames) == 0:
+            # Nothing to salvage, the whole request is retried
+            raise results[-1][1]
+        if cls.compact_dtypes:
+            # Categorical columns keep their type in concat only if their categories are the same
+            for column in ['Security', 'Field']:
+                categories = sorted(set().union(*(frame[column].cat.categories for frame in frames)))
+                for frame in frames:
+                    frame[column] = frame[column].cat.set_categories(categories)
+        return pd.concat(frames, ignore_index=True)
+
+    @classmethod
+    def _compact_timeseries(cls, ts_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Converts RICs and fields of normalized time series to categorical and values to float32 if required.
+        Batches are converted as soon as they are received, so strings of the whole range are never held at once.
+        """
+        if cls.compact_dtypes:
+            for column in ['Security', 'Field']:
+                ts_df[column] = ts_df[column].astype('category')
+        if cls.float32_values:
+            ts_df['Value'] = ts_df['Value'].astype(np.float32)
+        return ts_df
+
+    @classmethod
+    def get_timeseries(cls, rics: list, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Returns normalized time series. If local storage is configured only missing days are requested from Eikon.
+        """
+        if cls.ts_store is None:
+            return cls._fetch_timeseries(rics, start_date, end_date)
+
+        logger = getLogger()
+        for gap_start, gap_end, gap_rics in cls.ts_store.missing_ranges(rics, start_date, end_date):
+            logger.info(f"Запрашиваю отсутствующие в хранилище данные за период {gap_start} - {gap_end} "
+                        f"для {len(gap_rics)} RIC.")
+            cls.ts_store.save(cls._fetch_timeseries(gap_rics, gap_start, gap_end), gap_start, gap_end)
+        return cls._compact_timeseries(cls.ts_store.load(rics, cls.ts_fields, start_date, end_date))
+
+    @classmethod
+    def points_per_day(cls) -> int:
+        """
+        Number of values requested for a single day, used to size request windows.
+        """
+        return len(cls.rics) * len(cls.ts_fields)
+
+    @classmethod
+    def pivot_timeseries(cls, ts_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Turns normalized time series into a wide frame indexed by (Date, ric) with one column per field.
+        Dates are formatted once per unique date instead of once per row. In compact mode dates are kept as datetime64
+        and RICs stay categorical, so columns created from the index by reset_index hold no Python objects.
+        """
+        with RunMetrics.timer('reshape', getter=cls.__name__):
+            if cls.compact_dtypes:
+                return cls._pivot_categorical(ts_df)
+            result_df = ts_df.pivot(index=['Date', 'Security'], columns='Field', values='Value')
+            result_df.index = result_df.index.set_levels(
+                result_df.index.levels[0].strftime(cls.EIKON_DATE_FORMAT), level=0)
+            result_df.index.names = ['Date', 'ric']
+        return result_df
+
+    @staticmethod
+    def _pivot_categorical(ts_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Same as pivot for series with categorical RICs and fields, but values are placed into the result directly
+        by category codes without intermediate MultiIndex and unstack copies of the whole series.
+        """
+        date_codes, dates = pd.factorize(ts_df['Date'], sort=True)
+        rics = ts_df['Security'].cat.categories
+        ric_codes = ts_df['Security'].cat.codes.to_numpy()
+        field_codes = ts_df['Field'].cat.codes.to_numpy()
+        values = ts_df['Value'].to_numpy()
+        if values.dtype.kind != 'f':
+            values = values.astype(float)
+
+        valid = (date_codes >= 0) & (ric_codes >= 0) & (field_codes >= 0)
+        if not valid.all():
+            date_codes, ric_codes, field_codes, values = (date_codes[valid], ric_codes[valid], field_codes[valid],
+                                                          values[valid])
+        # Values are placed into a grid of all dates × RICs, ordered like pivot sorts its index since categories are
+        # sorted, and only cells which got values are kept
+        cells = date_codes * len(rics) + ric_codes
+        fields = ts_df['Field'].cat.categories
+        matrix = np.full((len(dates) * len(rics), len(fields)), np.nan, dtype=values.dtype)
+        matrix[cells, field_codes] = values
+        present = np.zeros(len(matrix), dtype=bool)
+        present[cells] = True
+        del cells
+        pairs = np.flatnonzero(present)
+        # Fields without values are skipped as pivot does
+        observed = np.bincount(field_codes, minlength=len(fields)) > 0
+        matrix = matrix[present] if observed.all() else matrix[np.ix_(present, observed)]
+        index = pd.MultiIndex(levels=[dates, pd.CategoricalIndex(rics)], codes=[pairs // len(rics), pairs % len(rics)],
+                              names=['Date', 'ric'])
+        return pd.DataFrame(matrix, index=index, columns=pd.Index(fields[observed].astype(object), name='Field'))
+
+    @classmethod
+    def find_missing_rics(cls, quotes: pd.DataFrame) -> list:
+        """
+        Returns RICs which are absent in retrieved data, keeping order of cls.rics.
+        """
+        present = set(quotes['ric'].unique())
+        return [ric for ric in cls.rics if ric not in present]
+
+    @classmethod
+    def run_calls(cls, calls: dict) -> dict:
+        """
+        Runs calls of get_data declared as a dependency graph: name -> (callable, names of calls it depends on).
+        Every call starts as soon as its dependencies are done, so independent API requests overlap.
+        """
+        return run_graph(calls, cls.call_workers)
+
+    @classmethod
+    def get_data(cls, start_date: str, end_date: str, rics: Optional[list] = None) -> pd.DataFrame:
+        """
+        Returns data for all RICs of the getter or only for the given ones.
+        """
         raise NotImplementedError("Please use available subclasses!")
 
     @classmethod
-    def retrieve_data(cls, start_date: str, end_date: str, date_range: str, retry: int, retry_delay: int) -> None:
+    def timeseries_columns(cls) -> list:
+        """
+        Columns of retrieved data filled from time series.
+        """
+        return list(cls.ts_fields)
+
+    @classmethod
+    def find_missing_ranges(cls, quotes: pd.DataFrame, start_date: str,
+                           end_date: str) -> List[Tuple[str, str, list]]:
+        """
+        Finds RICs worth requesting again: RICs without any time series value in the range, i.e. absent in Eikon
+        response or lost with a failed batch. Dates missing for RICs which have other values are holidays
+        or days without trading, they are not requested again.
+        :return: list of (start date, end date, RICs) to be requested again
+        """
+        has_values = quotes[cls.timeseries_columns()].notna().to_numpy().any(axis=1)
+        present = set(quotes['ric'][has_values].astype(object).unique())
+        missing = [ric for ric in cls.rics if ric not in present]
+        return [] if len(missing) == 0 else [(start_date, end_date, missing)]
+
+    @classmethod
+    def sort_quotes(cls, quotes: pd.DataFrame) -> pd.DataFrame:
+        """
+        Restores order of rows after salvaged rows were appended.
+        """
+        return quotes.sort_values(['Date', 'ric'], kind='stable', ignore_index=True)
+
+    @classmethod
+    def salvage(cls, quotes: pd.DataFrame, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Re-requests only RICs missing in retrieved data, see find_missing_ranges, and merges received rows. Stops after
+        salvage_rounds rounds or after the first round without errors.
+        """
+        logger = getLogger()
+        for salvage_round in range(1, cls.salvage_rounds + 1):
+            missing = cls.find_missing_ranges(quotes, start_date, end_date)
+            if len(missing) == 0:
+                break
+            logger.info(f"Повторно запрашиваю отсутствующие данные для {sum(len(rics) for _, _, rics in missing)} "
+                        f"RIC, раунд #{salvage_round} из {cls.salvage_rounds}.")
+            RunMetrics.add('salvage_rounds', getter=cls.__name__)
+            frames = []
+            failed = False
+            for range_start, range_end, range_rics in missing:
+                try:
+                    frames.append(cls.get_data(range_start, range_end, range_rics))
+                except ek.eikonError.EikonError as err:
+                    logger.warning(f"Не удалось повторно получить данные за период {range_start} - {range_end} "
+                                   f"для {len(range_rics)} RIC: {err.message}")
+                    failed = True
+            received = sum(int(frame[cls.timeseries_columns()].notna().to_numpy().any(axis=1).sum())
+                           for frame in frames)
+            if received > 0:
+                categorical = [column for column, dtype in quotes.dtypes.items()
+                               if isinstance(dtype, pd.CategoricalDtype)]
+                # Received rows replace rows of the same RICs which came without time series values
+                merged = pd.concat([*frames, quotes], ignore_index=True).drop_duplicates(cls.sink_key, keep='first')
+                # Concatenation of categories which differ turns columns into objects
+                for column in categorical:
+                    merged[column] = merged[column].astype('category')
+                RunMetrics.add('salvaged_rows', received, getter=cls.__name__)
+                quotes = cls.sort_quotes(merged)
+            if not failed:
+                # RICs still missing after a successful request have no data for the range
+                break
+            sleep(backoff_delay(salvage_round, cls.chunk_retry_delay, cls.retry_delay_cap))
+        return quotes
+
+    @classmethod
+    def retrieve_data(cls, start_date: str, end_date: str, date_range: str, retry: int, retry_delay: int) -> bool:
+        """
+        Retrieves data for the range, loads it into the database sink if configured, saves it to disk and mails it.
+        :return: True if data was retrieved and delivered, False if retrieval failed and errors were mailed instead
+        """
+        with RunMetrics.timer('retrieve_data', getter=cls.__name__):
+            return cls._retrieve_data(start_date, end_date, date_range, retry, retry_delay) is not None
+
+    @classmethod
+    def _delivered(cls, start_date: str, end_date: str, date_range: str, output: Optional[str],
+                   hashes: Optional[pd.DataFrame]) -> None:
+        """
+        Called once results for the range are actually delivered: marks rows as delivered and the range as completed.
+        Range delivered only partially has no output and is not marked as completed.
+        """
+        if hashes is not None:
+            cls.delivery_index.commit(cls.__name__, hashes)
+        if output is None or cls.journal is None:
+            return
+        if cls.journal.record(cls.__name__, start_date, end_date, output):
+            getLogger().debug(f"Период {date_range} отмечен в журнале как выгруженный.")
+
+    @classmethod
+    def _retrieve_data(cls, start_date: str, end_date: str, date_range: str, retry: int,
+                       retry_delay: int) -> Optional[str]:
+        """
+        :return: where data was delivered or None if retrieval failed
+        """
         logger = getLogger()
         quotes = None
-        for _ in range(1, retry):
+        for _ in range(1, retry + 1):
             logger.info(f"Выгружаю {cls.data_name['nom_acc']} за период {date_range}, попытка #{_} из {retry}.")
             try:
-                quotes = cls.get_data(start_date, end_date)
+                with RunMetrics.timer('get_data', getter=cls.__name__):
+                    quotes = cls.get_data(start_date, end_date)
+                if cls.salvage_rounds > 0:
+                    with RunMetrics.timer('salvage', getter=cls.__name__):
+                        quotes = cls.salvage(quotes, start_date, end_date)
                 break
             except ek.eikonError.EikonError as err:
                 if err.message in cls.error_messages_retry:
-                    # Wait and try again
-                    sleep(retry_delay * _)
+                    logger.warning(f"Ошибка при выгрузке {cls.data_name['gen']}: {err.message}")
+                    if _ < retry:
+                        RunMetrics.add('retries', getter=cls.__name__)
+                        # Wait and try again
+                        sleep(backoff_delay(_, retry_delay, cls.retry_delay_cap))
                 else:
                     err_msg = f"Что-то пошло не так при загрузке искомых {cls.data_name['gen']}! Детали: "
                     err_list = err.message.split('|')
@@ -55,35 +394,83 @@ class EikonDataGetter(object):
                             err_msg = err_msg + "\n\r" + single_err.strip()
                     logger.error(err_msg)
                     send_email(None, cls.mail_header_getter(date_range), [err_msg])
-                    return
+                    return None
             except Exception as err:
                 err_msg = f"Не удалось получить данные по искомым {cls.data_name['dat']}. Детали: " + err.__str__()
                 logger.error(err_msg)
                 send_email(None, cls.mail_header_getter(date_range), [err_msg])
-                return
+                return None
 
         if quotes is None:
             send_email(None, cls.mail_header_getter(date_range),
                        [f"Отсутствуют данные по искомым {cls.data_name['dat']}."])
-            return
+            return None
 
         logger.info(f"Выгрузка {cls.data_name['gen']} успешно завершена!")
+        RunMetrics.add('rows', len(quotes), getter=cls.__name__)
         error_list = []
 
         # Check for missing data
-        for ric in cls.rics:
-            if ric not in quotes.ric.values:
-                msg = f"Не удалось получить данные для {ric}!"
-                error_list.append(msg)
+        for ric in cls.find_missing_rics(quotes):
+            error_list.append(f"Не удалось получить данные для {ric}!")
+        RunMetrics.add('missing_rics', len(error_list), getter=cls.__name__)
+
+        hashes = None
+        if cls.delivery_index is not None:
+            with RunMetrics.timer('delta', getter=cls.__name__):
+                quotes, hashes = cls.delivery_index.diff(cls.__name__, quotes, cls.sink_key)
+            RunMetrics.add('delivered_rows', len(quotes), getter=cls.__name__)
+            if len(quotes) == 0:
+                logger.info(f"{cls.data_name['nom_acc'].capitalize()} за период {date_range} не изменились "
+                            f"с прошлой отправки.")
+                send_email(None, cls.mail_header_getter(date_range), error_list)
+                cls._delivered(start_date, end_date, date_range, 'unchanged', None)
+                return 'unchanged'
+            logger.info(f"К отправке {len(quotes)} новых или изменённых строк.")
+
+        sink_loaded = False
+        if cls.sink is not None:
+            try:
+                with RunMetrics.timer('sink', getter=cls.__name__):
+                    rows = cls.sink.write(quotes, cls.sink_table, cls.sink_key)
+                logger.info(f"{cls.data_name['nom_acc'].capitalize()} за период {date_range} загружены в таблицу "
+                            f"{cls.sink_table}: {rows} строк.")
+                sink_loaded = True
+            except Exception as err:
+                err_msg = f"Не удалось загрузить {cls.data_name['nom_acc']} в базу данных. Детали: {err}"
+                logger.error(err_msg)
+                if not cls.mail_data:
+                    send_email(None, cls.mail_header_getter(date_range), [*error_list, err_msg])
+                    return None
+                error_list.append(err_msg)
+                # Rows missing in the database are delivered again next time, so neither rows nor the range
+                # are marked as delivered
+                hashes = None
+
+        if not cls.mail_data:
+            # Only errors are mailed
+            send_email(None, cls.mail_header_getter(date_range), error_list)
+            cls._delivered(start_date, end_date, date_range, f'sink:{cls.sink_table}', hashes)
+            return f'sink:{cls.sink_table}'
 
         # Saving merged data to disk
-        file_path = f'{cls.folder_to_save}/{cls.file_prefix}_{date_range}_' \
-            f'{datetime.now().strftime(cls.save_timestamp_formatter)}.csv'
-        quotes.to_csv(file_path, index=False)
+        with RunMetrics.timer('write', getter=cls.__name__, format=cls.output_format):
+            file_path = write_frame(quotes, f'{cls.folder_to_save}/{cls.file_prefix}_{date_range}_'
+                                            f'{datetime.now().strftime(cls.save_timestamp_formatter)}',
+                                    cls.output_format)
+        RunMetrics.add('output_bytes', path.getsize(file_path), getter=cls.__name__)
         logger.info(f"{cls.data_name['nom_acc'].capitalize()} за период {date_range} были сохранёны в '{file_path}'.")
 
-        # Mail file and errors if there are any to target e-mail
-        send_email(file_path, cls.mail_header_getter(date_range), error_list)
+        # Mail file and errors if there are any to target e-mail. Rows and the range are marked as delivered only
+        # once the file is actually sent, the outbox sends it later
+        output = f'{file_path};sink:{cls.sink_table}' if sink_loaded else file_path
+        # Range is not completed if rows failed to reach the database
+        completed = cls.sink is None or sink_loaded
+        with RunMetrics.timer('send_email', getter=cls.__name__):
+            send_email(file_path, cls.mail_header_getter(date_range), error_list,
+                       partial(cls._delivered, start_date, end_date, date_range, output if completed else None,
+                               hashes))
+        return output
 
 
 class FXRateGetter(EikonDataGetter):
@@ -94,38 +481,92 @@ class FXRateGetter(EikonDataGetter):
     data_name = {'nom_acc': 'курсы валют', 'gen': 'курсов валют', 'dat': 'курсам валют'}
     folder_to_save = 'fx_data'
     file_prefix = 'fx_rates'
+    sink_table = 'fx_rates'
     mail_header_getter = MailSubjects.get_fx_rates
     rics = ['USDEUR=R', 'PLNEUR=R', 'GBPEUR=R', 'CZKEUR=R', 'HRKEUR=R', 'HUFEUR=R', 'BGNEUR=R', 'RONEUR=R', 'RUBEUR=R',
             'CHFEUR=R', 'TRY=']
     data_fields = ["TR.BIDPRICE", "TR.ASKPRICE", "TR.MIDPRICE", "TR.MIDPRICE.Date"]
     data_interval = 'D'
 
+    # Optional local storage of already requested data part, kept separately from time series
+    data_store: Optional[TimeSeriesStore] = None
+    # Columns returned by get_data for data fields except date
+    data_columns = ['Bid Price', 'Ask Price', 'Mid Price']
+
     @classmethod
-    def get_data(cls, start_date: str, end_date: str) -> pd.DataFrame:
-        # Get time series part of required information
-        ts_df = ek.get_timeseries(cls.rics, cls.ts_fields, start_date=start_date, end_date=end_date,
-                                  interval=cls.ts_interval, normalize=True)
+    def points_per_day(cls) -> int:
+        return len(cls.rics) * (len(cls.ts_fields) + len(cls.data_fields))
 
-        ts_df['Date'] = ts_df['Date'].dt.strftime(cls.EIKON_DATE_FORMAT)
-        ts_df.rename({'Security': 'ric'}, axis=1, inplace=True)
-        ts_df.set_index(['Date', 'ric', 'Field'], inplace=True)
-        result_df = ts_df.unstack()
-        result_df.columns = result_df.columns.get_level_values(1)
+    @classmethod
+    def _fetch_data(cls, rics: list, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        """
+        Returns data part of required information indexed by (Date, ric) or None if there is no data.
+        """
+        data_df, err = cls.call_api(ek.get_data, rics, cls.data_fields,
+                                    {'SDate': start_date, 'EDate': end_date, 'FRQ': cls.data_interval})
+        if data_df["Date"].count() == 0:
+            return None
+
+        data_df.dropna(inplace=True)
+        data_df['Date'] = data_df['Date'].str[:10]
+        if cls.compact_dtypes:
+            data_df['Date'] = pd.to_datetime(data_df['Date'], format=cls.EIKON_DATE_FORMAT)
+        data_df.rename({'Instrument': 'ric'}, axis=1, inplace=True)
+        data_df.set_index(['Date', 'ric'], inplace=True)
+        return data_df
+
+    @classmethod
+    def get_data_part(cls, rics: list, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        """
+        Returns data part indexed by (Date, ric) or None if there is no data. If local storage is configured only
+        missing days are requested from Eikon.
+        """
+        if cls.data_store is None:
+            return cls._fetch_data(rics, start_date, end_date)
 
-        # Get data part of required information
-        data_df, err = ek.get_data(cls.rics, cls.data_fields, {'SDate': start_date, 'EDate': end_date,
-                                                               'FRQ': cls.data_interval})
+        logger = getLogger()
+        for gap_start, gap_end, gap_rics in cls.data_store.missing_ranges(rics, start_date, end_date):
+            logger.info(f"Запрашиваю отсутствующие в хранилище данные {', '.join(cls.data_columns)} за период "
+                        f"{gap_start} - {gap_end} для {len(gap_rics)} RIC.")
+            data_df = cls._fetch_data(gap_rics, gap_start, gap_end)
+            if data_df is not None:
+                # Stored in the same normalized form as time series
+                data_df = data_df.reset_index().melt(id_vars=['Date', 'ric'], value_vars=cls.data_columns,
+                                                     var_name='Field', value_name='Value')
+                data_df.rename({'ric': 'Security'}, axis=1, inplace=True)
+                data_df['Date'] = pd.to_datetime(data_df['Date'], format=cls.EIKON_DATE_FORMAT)
+                cls.data_store.save(data_df, gap_start, gap_end)
 
-        if data_df["Date"].count() > 0:
-            data_df.dropna(inplace=True)
-            data_df['Date'] = data_df['Date'].str[:10]
-            data_df.rename({'Instrument': 'ric'}, axis=1, inplace=True)
-            data_df.set_index(['Date', 'ric'], inplace=True)
-            result_df = pd.concat([result_df, data_df], axis=1)
+        data_df = cls.data_store.load(rics, cls.data_columns, start_date, end_date)
+        if len(data_df) == 0:
+            return None
+        if not cls.compact_dtypes:
+            data_df['Date'] = data_df['Date'].dt.strftime(cls.EIKON_DATE_FORMAT)
+        data_df = data_df.pivot(index=['Date', 'Security'], columns='Field', values='Value')
+        data_df = data_df.reindex(columns=cls.data_columns)
+        data_df.columns.name = None
+        data_df.index.names = ['Date', 'ric']
+        return data_df
 
+    @classmethod
+    def _join_data(cls, timeseries: pd.DataFrame, data: Optional[pd.DataFrame]) -> pd.DataFrame:
+        # Rows found only by get_data are appended after time series rows
+        result_df = timeseries if data is None else pd.concat([timeseries, data], axis=1)
         result_df.reset_index(inplace=True)
+        if cls.compact_dtypes:
+            # Concatenation with get_data result turns RICs back into objects
+            result_df['ric'] = result_df['ric'].astype('category')
         return result_df
 
+    @classmethod
+    def get_data(cls, start_date: str, end_date: str, rics: Optional[list] = None) -> pd.DataFrame:
+        rics = cls.rics if rics is None else rics
+        # Time series and data parts of required information are requested at the same time
+        return cls.run_calls({
+            'timeseries': (lambda: cls.pivot_timeseries(cls.get_timeseries(rics, start_date, end_date)), []),
+            'data': (lambda: cls.get_data_part(rics, start_date, end_date), []),
+            'quotes': (cls._join_data, ['timeseries', 'data'])})['quotes']
+
 
 class GasPricesGetter(EikonDataGetter):
     """
@@ -137,41 +578,80 @@ class GasPricesGetter(EikonDataGetter):
     data_name = {'nom_acc': 'цены на газ', 'gen': 'цен на газ', 'dat': 'ценам на газ'}
     folder_to_save = 'gas_data'
     file_prefix = 'prices'
+    sink_table = 'gas_prices'
     mail_header_getter = MailSubjects.get_gas_prices
     rics = gas_rics
 
+    # Optional on-disk cache of CF_CURR / LOTSZUNITS
+    meta_cache: Optional[MetadataCache] = None
+    meta_columns = ['orig_cur', 'orig_unit']
+    # Explicitly defined default units
+    unit_overrides = pd.Series({ric: spec['def_unit'] for ric, spec in gas_rics.items()
+                                if isinstance(spec, dict) and 'def_unit' in spec}, dtype=object)
+    ts_columns = {'HIGH': 'orig_high', 'LOW': 'orig_low', 'OPEN': 'orig_open', 'CLOSE': 'orig_close'}
+
+    @classmethod
+    def timeseries_columns(cls) -> list:
+        return [cls.ts_columns[field] for field in cls.ts_fields]
+
     @classmethod
-    def get_data(cls, start_date: str, end_date: str) -> pd.DataFrame:
+    def _fetch_metadata(cls, rics: list) -> pd.DataFrame:
         # Get units for all RICs
-        lots_df = ek.get_data(list(cls.rics.keys()), ['CF_CURR', 'LOTSZUNITS'])[0]
+        lots_df = cls.call_api(ek.get_data, rics, ['CF_CURR', 'LOTSZUNITS'])[0]
         lots_df.rename({'LOTSZUNITS': 'orig_unit', 'CF_CURR': 'orig_cur', 'Instrument': 'ric'}, axis=1, inplace=True)
         lots_df.orig_unit = lots_df.orig_unit.str.strip()
-        lots_df.rename({'Instrument': 'ric'}, axis=1, inplace=True)
         # Replace N/A values to default values
         lots_df['orig_cur'].fillna(cls.def_gas_cur, inplace=True)
         lots_df['orig_unit'].fillna(cls.def_gas_unit, inplace=True)
         # For all RICs with explicitly defined default units update values
-        for ric in gas_rics:
-            if isinstance(gas_rics[ric], dict) and 'def_unit' in gas_rics[ric]:
-                lots_df.loc[lots_df.ric == ric, 'orig_unit'] = gas_rics[ric]['def_unit']
-
-        ts_df = ek.get_timeseries(list(cls.rics.keys()), cls.ts_fields, start_date=start_date, end_date=end_date,
-                                  interval=cls.ts_interval, normalize=True)
-
-        # Somehow sometimes redundant columns appear and should be deleted
-        for column in cls.ts_fields:
-            if column in ts_df.columns:
-                del ts_df[column]
-
-        ts_df['Date'] = ts_df['Date'].dt.strftime(cls.EIKON_DATE_FORMAT)
-        ts_df.rename({'Security': 'ric'}, axis=1, inplace=True)
-        ts_df.set_index(['Date', 'ric', 'Field'], inplace=True)
-        result_df = ts_df.unstack()
-        result_df.columns = result_df.columns.get_level_values(1)
-        result_df.reset_index(inplace=True)
-        # Add units and currencies
-        result_df = result_df.merge(lots_df)
+        lots_df['orig_unit'] = lots_df['ric'].map(cls.unit_overrides).fillna(lots_df['orig_unit'])
+        return lots_df
+
+    @classmethod
+    def get_metadata(cls, rics: list) -> pd.DataFrame:
+        """
+        Returns currency and unit for given RICs. If cache is configured only stale or new RICs are requested.
+        """
+        if cls.meta_cache is None:
+            return cls._fetch_metadata(rics)
+
+        stale_rics = cls.meta_cache.stale(rics)
+        if len(stale_rics) > 0:
+            getLogger().info(f"Запрашиваю метаданные для {len(stale_rics)} RIC.")
+            cls.meta_cache.update(cls._fetch_metadata(stale_rics))
+        return cls.meta_cache.frame(rics)
+
+    @classmethod
+    def get_data(cls, start_date: str, end_date: str, rics: Optional[list] = None) -> pd.DataFrame:
+        rics = list(cls.rics.keys()) if rics is None else rics
+        # Metadata and time series are requested at the same time.
+        # Redundant columns which sometimes appear are skipped by pivot
+        return cls.run_calls({
+            'metadata': (lambda: cls.get_metadata(rics), []),
+            'timeseries': (lambda: cls.pivot_timeseries(cls.get_timeseries(rics, start_date, end_date)), []),
+            'quotes': (cls._join_metadata, ['timeseries', 'metadata'])})['quotes']
+
+    @classmethod
+    def sort_quotes(cls, quotes: pd.DataFrame) -> pd.DataFrame:
+        # Rows are grouped by RIC
+        return quotes.sort_values(['ric', 'Date'], kind='stable', ignore_index=True)
+
+    @classmethod
+    def _join_metadata(cls, timeseries: pd.DataFrame, metadata: pd.DataFrame) -> pd.DataFrame:
+        """
+        Adds units and currencies looked up by RIC level of the (Date, ric) index. RICs without them are dropped and
+        rows are grouped by RIC like inner merge does. Rows are filtered and ordered by a single take and columns are
+        added in place to avoid copies of the frame.
+        """
+        result_df = timeseries.reset_index()
+        meta_df = metadata.drop_duplicates('ric').set_index('ric')
+        positions = np.flatnonzero(result_df['ric'].isin(meta_df.index).to_numpy())
+        positions = positions[pd.factorize(result_df['ric'])[0][positions].argsort(kind='stable')]
+        result_df = result_df.take(positions)
+        result_df.reset_index(drop=True, inplace=True)
+        for column in cls.meta_columns:
+            values = result_df['ric'].map(meta_df[column])
+            result_df[column] = values.astype('category') if cls.compact_dtypes else values
         # Set required names
-        result_df.rename({'HIGH': 'orig_high', 'LOW': 'orig_low', 'OPEN': 'orig_open', 'CLOSE': 'orig_close'},
-                         axis=1, inplace=True)
+        result_df.rename(cls.ts_columns, axis=1, inplace=True)
         return result_df
@@ -1,14 +1,21 @@
 from logging import getLogger
 from os import system
-from time import sleep
+from typing import Optional
 
 import eikon as ek
 from pywinauto import Application
 from pywinauto.findwindows import ElementNotFoundError
 from pywinauto.keyboard import send_keys
 
-from lib.email import send_email
 from lib.env import get_env
+from lib.metrics import RunMetrics
+from lib.readiness import find_ready_proxy, wait_until
+
+
+class EikonSessionError(Exception):
+    """
+    Terminal can't be started or API Proxy can't be connected.
+    """
 
 
 class EikonDesktop(object):
@@ -21,12 +28,28 @@ class EikonDesktop(object):
 
     _SPLASH_SCREEN_TITLE = get_env('EIKON_SPLASH_SCREEN_TITLE')
     _TOOLBAR_TITLE = 'Eikon Toolbar'
-    _RETRIEVE_EIKON_DATA = 'Загрузка данных из Refinitiv Eikon'
     _DONE_MSG = 'Готово!'
+    # Maximum waiting times, probes are repeated every poll_interval seconds until they succeed
     login_timer = 25
-    app_timer = 50
+    app_timer = 120
+    poll_interval = 1
+    proxy_host = '127.0.0.1'
+    proxy_ports = list(range(9000, 9010))
 
     @classmethod
+    def login_form_present(cls) -> bool:
+        try:
+            Application(backend="uia").connect(title=cls._SPLASH_SCREEN_TITLE)
+            return True
+        except ElementNotFoundError:
+            return False
+
+    @classmethod
+    def proxy_port(cls) -> Optional[int]:
+        return find_ready_proxy(cls.proxy_host, cls.proxy_ports)
+
+    @classmethod
+    @RunMetrics.timed('eikon_launch')
     def launch(cls) -> None:
         logger = getLogger()
         eikon_user = get_env('EIKON_USER')
@@ -35,67 +58,77 @@ class EikonDesktop(object):
         logger.info("Запускаю Refinitiv Eikon!")
         Application(backend="uia").start(cls._EIKON_PATH)
         logger.info("Жду появления формы авторизации...")
-        sleep(cls.login_timer)
-        try:
+        # Login form appears or API Proxy is ready at once if user is already logged in
+        wait_until(lambda: cls.login_form_present() or cls.proxy_port() is not None, cls.login_timer,
+                   cls.poll_interval)
+        if cls.login_form_present():
             logger.info(cls._DONE_MSG)
-            # Try to connect to login form.
-            Application(backend="uia").connect(title=cls._SPLASH_SCREEN_TITLE)
             # Select 'User ID' input box and enter user ID
             # TODO: find more stable way
             send_keys(eikon_user + '{TAB}' + eikon_pass + '{TAB}{TAB}~')
             logger.info("Жду исчезновения формы авторизации...")
-            sleep(cls.login_timer)
-            try:
-                logger.info(cls._DONE_MSG)
-                # Try to connect to login form. It should not be found due to authorization attempt
-                Application(backend="uia").connect(title=cls._SPLASH_SCREEN_TITLE)
+            if not wait_until(lambda: not cls.login_form_present(), cls.login_timer, cls.poll_interval):
                 # If it is still running, someone else is already being logged in. Force to login here
                 logger.info("Появился запрос подтверждения принудительного входы в систему. Продолжаю вход.")
                 # Select 'Sign In' option and press 'Enter'
                 send_keys('{TAB}~')
                 logger.info("Жду исчезновения формы...")
-                sleep(cls.login_timer)
-                logger.info(cls._DONE_MSG)
-                # Try to connect to splash screen last time. It should not be found due to send keys
-                Application(backend="uia").connect(title=cls._SPLASH_SCREEN_TITLE)
-                # If it is found again something is really wrong
-                err_msg = "Не удаётся войти в Refinitiv Eikon, требуется анализ!"
-                logger.error(err_msg)
-                send_email(None, cls._RETRIEVE_EIKON_DATA, [err_msg])
-                exit(-1)
-            except ElementNotFoundError:
-                logger.info("Вход был успешно завершён!")
-        except ElementNotFoundError:
+                if not wait_until(lambda: not cls.login_form_present(), cls.login_timer, cls.poll_interval):
+                    # If it is found again something is really wrong
+                    raise EikonSessionError("Не удаётся войти в Refinitiv Eikon, требуется анализ!")
+            logger.info("Вход был успешно завершён!")
+        else:
             logger.warning("Форма авторизации не появилась, возможно, вход уже был выполнен!")
 
         logger.info("Ожидаю загрузки Refinitiv Eikon Desktop...")
-        sleep(cls.app_timer)
+        port = wait_until(cls.proxy_port, cls.app_timer, cls.poll_interval)
+        if port is None:
+            logger.warning(f"API Proxy не ответил о готовности за {cls.app_timer} секунд.")
+        else:
+            logger.info(f"API Proxy готов на порту {port}.")
         logger.info(cls._DONE_MSG)
 
     @classmethod
+    def _set_app_key(cls, eikon_key: str) -> bool:
+        try:
+            ek.set_app_key(eikon_key)
+            return True
+        except ek.eikonError.EikonError:
+            return False
+
+    @classmethod
+    @RunMetrics.timed('eikon_connect')
     def connect(cls) -> None:
         logger = getLogger()
         eikon_key = get_env('EIKON_KEY')
 
         logger.info(f"Подключаюсь к Refinitiv Eikon Proxy...")
-        try:
-            # Try to connect
-            ek.set_app_key(eikon_key)
-        except ek.eikonError.EikonError:
-            # If cannot connect wait a bit and try again
-            logger.warning(f"Не могу обнаружить API Proxy. Повторная проверка через {cls.app_timer} секунд")
-            sleep(cls.app_timer)
-            try:
-                # Try to connect again
-                ek.set_app_key(eikon_key)
-            except ek.eikonError.EikonError:
-                # If cannot connect again notify administrator and exit
-                err_msg = "Вновь не могу обнаружить API Proxy. Что-то пошло не так, требуется анализ..."
-                logger.error(err_msg)
-                send_email(None, cls._RETRIEVE_EIKON_DATA, [err_msg])
-                exit(-1)
+        if not cls._set_app_key(eikon_key):
+            # If cannot connect wait until API Proxy is ready and try again
+            logger.warning(f"Не могу обнаружить API Proxy. Ожидаю готовности не более {cls.app_timer} секунд")
+            wait_until(cls.proxy_port, cls.app_timer, cls.poll_interval)
+            if not wait_until(lambda: cls._set_app_key(eikon_key), cls.poll_interval * 5, cls.poll_interval):
+                # If cannot connect again the caller notifies administrator
+                raise EikonSessionError("Вновь не могу обнаружить API Proxy. Что-то пошло не так, требуется анализ...")
         logger.info(cls._DONE_MSG)
 
+    @classmethod
+    def is_healthy(cls) -> bool:
+        """
+        Checks that API Proxy is still ready to serve requests.
+        """
+        return cls.proxy_port() is not None
+
+    @classmethod
+    def reconnect(cls, relaunch: bool) -> None:
+        """
+        Re-establishes connection to API Proxy. If it doesn't respond and relaunch is allowed terminal is restarted.
+        """
+        if relaunch and wait_until(cls.proxy_port, cls.poll_interval * 5, cls.poll_interval) is None:
+            cls.close()
+            cls.launch()
+        cls.connect()
+
     @classmethod
     def close(cls):
         logger = getLogger()
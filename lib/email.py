@@ -1,15 +1,25 @@
+import atexit
+import gzip
+import re
+from base64 import b64encode
 from email.encoders import encode_base64
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from email.policy import compat32
 from logging import getLogger
+from math import ceil
 from os import path, remove
-from smtplib import SMTP_SSL
+from queue import Queue
+from shutil import copyfileobj
+from smtplib import SMTP_SSL, SMTPDataError, SMTPRecipientsRefused, SMTPSenderRefused, SMTPServerDisconnected
 from ssl import create_default_context
 from string import Template
-from typing import Optional
+from threading import Lock, Thread
+from typing import Callable, List, Optional, Tuple
 
 from lib.env import get_env
+from lib.metrics import RunMetrics
 
 
 class MailSubjects:
@@ -18,6 +28,7 @@ class MailSubjects:
     unk_err_start_eikon = "Неожиданная ошибка при запуске терминала"
     unk_err_connect_eikon = "Неожиданная ошибка при подключении к API Proxy"
     unk_err_load_data = "Неожиданная ошибка при выгрузке и отправке данных"
+    errors_digest = "Ошибки при выгрузке и отправке данных"
 
     @staticmethod
     def get_fx_rates(date: str) -> str:
@@ -39,54 +50,335 @@ class MailSubjects:
     def get_unk_err_load_data() -> str:
         return MailSubjects.unk_err_load_data
 
+    @staticmethod
+    def get_errors_digest() -> str:
+        return MailSubjects.errors_digest
+
 
 MESSAGE_TEMPLATE = Template("Приветствую!\n\n$payload\n\nИскренне Ваш, ИИ.")
 eol = '\n'
 
 
-def send_email(attachment: Optional[str], subject: str, error_list: Optional[list] = None) -> None:
-    context = create_default_context()
+class AttachmentPolicy(object):
+    """
+    Settings of attachments sent by streaming: compression, maximum size of a single message and read size.
+    """
+
+    # Size of the whole message as sent to the server, i.e. with base64 encoded attachment
+    max_size: Optional[int] = None
+    compress = False
+    compressed_extensions = ('.gz', '.parquet', '.feather')
+    # Multiple of 57 bytes, so that every chunk is encoded into complete 76 characters base64 lines
+    read_size = 57 * 1024
+    # Reserved for headers and text part of the message
+    headers_size = 4096
+
+    _PAYLOAD_MARKER = 'ATTACHMENT-PAYLOAD'
+
+    @classmethod
+    def part_size(cls, file_size: int) -> int:
+        """
+        Returns number of file bytes sent in a single message, so that the message doesn't exceed max_size.
+        Every 57 bytes of file are encoded into a 76 characters base64 line followed by CRLF.
+        """
+        if cls.max_size is None:
+            return max(1, file_size)
+        return max(57, (cls.max_size - cls.headers_size) // 78 * 57)
+
+
+def compose_data_message(attachment: str, subject: str, sender: str, recipient: str) -> MIMEMultipart:
+    message = MESSAGE_TEMPLATE.substitute(payload="Данные во вложении.")
+
+    # Compose message
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg.attach(MIMEText(message, "plain"))
+
+    # Add attachment
+    basename = path.basename(attachment)
+    part = MIMEBase('application', "octet-stream")
+    with open(attachment, "rb") as file:
+        part.set_payload(file.read())
+    encode_base64(part)
+    part.add_header('Content-Disposition', 'attachment; filename="%s"' % basename)
+    msg.attach(part)
+    return msg
+
+
+def compose_error_message(subject: str, sender: str, recipient: str, error_list: list) -> MIMEMultipart:
+    error_message = MESSAGE_TEMPLATE.substitute(payload=f"При загрузке и отправке данных произошли следующие "
+                                                        f"ошибки:\n{eol.join(error_list)}")
+
+    # Compose message
+    err_msg = MIMEMultipart()
+    err_msg['Subject'] = f'Ошибки при подготовке письма "{subject}"'
+    err_msg['From'] = sender
+    err_msg['To'] = recipient
+    err_msg.attach(MIMEText(error_message, "plain"))
+    return err_msg
+
+
+def compose_digest_message(sender: str, recipient: str, errors: List[Tuple[str, list]]) -> MIMEMultipart:
+    sections = [f'{subject}:\n{eol.join(error_list)}' for subject, error_list in errors]
+    digest_message = MESSAGE_TEMPLATE.substitute(payload=f"При загрузке и отправке данных произошли следующие "
+                                                         f"ошибки:\n\n{(eol * 2).join(sections)}")
+
+    # Compose message
+    digest_msg = MIMEMultipart()
+    digest_msg['Subject'] = MailSubjects.get_errors_digest()
+    digest_msg['From'] = sender
+    digest_msg['To'] = recipient
+    digest_msg.attach(MIMEText(digest_message, "plain"))
+    return digest_msg
+
+
+@RunMetrics.timed('smtp_connect')
+def _connect() -> SMTP_SSL:
+    server = SMTP_SSL(get_env('GASDB_SMTP_SERVER'), int(get_env('GASDB_SMTP_PORT')), context=create_default_context())
+    server.login(get_env('GASDB_SMTP_LOGIN'), get_env('GASDB_SMTP_PASS'))
+    return server
+
+
+def _prepare_attachment(attachment: str) -> str:
+    """
+    Compresses attachment chunk by chunk if required and returns path of the file to be sent.
+    """
+    if not AttachmentPolicy.compress or attachment.endswith(AttachmentPolicy.compressed_extensions):
+        return attachment
+    with open(attachment, 'rb') as src, gzip.open(attachment + '.gz', 'wb') as dst:
+        copyfileobj(src, dst, AttachmentPolicy.read_size)
+    return attachment + '.gz'
+
+
+def _stream_data_message(server: SMTP_SSL, file_path: str, offset: int, length: int, filename: str, subject: str,
+                         payload: str, sender: str, recipient: str) -> None:
+    """
+    Sends message with a part of file as attachment. The part is read and base64 encoded chunk by chunk
+    and written directly to SMTP connection, so the whole message is never held in memory.
+    """
+    # Compose message with a marker in place of attachment content
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg.attach(MIMEText(MESSAGE_TEMPLATE.substitute(payload=payload), "plain"))
+    part = MIMEBase('application', "octet-stream")
+    part.set_payload(AttachmentPolicy._PAYLOAD_MARKER)
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', 'attachment; filename="%s"' % filename)
+    msg.attach(part)
+    head, tail = msg.as_bytes(policy=compat32.clone(linesep='\r\n')).split(AttachmentPolicy._PAYLOAD_MARKER.encode(), 1)
+
+    # Envelope
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(sender)
+    if code != 250:
+        raise SMTPSenderRefused(code, resp, sender)
+    recipients = [address.strip() for address in recipient.split(",")]
+    refused = {}
+    for address in recipients:
+        code, resp = server.rcpt(address)
+        if code not in (250, 251):
+            refused[address] = (code, resp)
+    if len(refused) == len(recipients):
+        raise SMTPRecipientsRefused(refused)
+    code, resp = server.docmd('data')
+    if code != 354:
+        raise SMTPDataError(code, resp)
+
+    # Content, lines starting with a period are escaped. Base64 lines never start with it
+    server.send(re.sub(rb'(?m)^\.', b'..', head))
+    with open(file_path, 'rb') as file:
+        file.seek(offset)
+        remaining = length
+        separator = b''
+        while remaining > 0:
+            chunk = file.read(min(AttachmentPolicy.read_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            encoded = b64encode(chunk)
+            server.send(separator + b'\r\n'.join(encoded[i:i + 76] for i in range(0, len(encoded), 76)))
+            separator = b'\r\n'
+    tail = re.sub(rb'(?m)^\.', b'..', tail)
+    server.send(tail if tail.endswith(b'\r\n') else tail + b'\r\n')
+    server.send(b'.\r\n')
+    code, resp = server.getreply()
+    if code != 250:
+        raise SMTPDataError(code, resp)
+
+
+def _send_attachment(server: SMTP_SSL, attachment: str, subject: str, sender: str, recipient: str) -> None:
+    """
+    Sends attachment, splitting it into several numbered messages if it exceeds maximum size.
+    """
+    logger = getLogger()
+    file_path = _prepare_attachment(attachment)
+    try:
+        basename = path.basename(file_path)
+        size = path.getsize(file_path)
+        RunMetrics.add('mail_attachment_bytes', size)
+        part_size = AttachmentPolicy.part_size(size)
+        parts = max(1, ceil(size / part_size))
+        for idx in range(parts):
+            if parts == 1:
+                _stream_data_message(server, file_path, 0, size, basename, subject, "Данные во вложении.", sender,
+                                     recipient)
+            else:
+                _stream_data_message(server, file_path, idx * part_size, min(part_size, size - idx * part_size),
+                                     f'{basename}.{idx + 1:03d}', f'{subject} (часть {idx + 1} из {parts})',
+                                     f"Данные во вложении, часть {idx + 1} из {parts}. Для восстановления файла "
+                                     f"{basename} объедините все части по порядку.", sender, recipient)
+        logger.info(f'Письмо с данными успешно отправлено {recipient}' +
+                    (f' ({parts} частей)' if parts > 1 else ''))
+    finally:
+        if file_path != attachment and path.exists(file_path):
+            remove(file_path)
+
+
+@RunMetrics.timed('smtp_deliver')
+def _deliver(server: SMTP_SSL, attachment: Optional[str], subject: str, error_list: Optional[list]) -> None:
     logger = getLogger()
-    with SMTP_SSL(get_env('GASDB_SMTP_SERVER'), int(get_env('GASDB_SMTP_PORT')), context=context) as server:
-        server.login(get_env('GASDB_SMTP_LOGIN'), get_env('GASDB_SMTP_PASS'))
-        sender = get_env('GASDB_SMTP_SENDER')
-        if attachment is not None:
-            message = MESSAGE_TEMPLATE.substitute(payload="Данные во вложении.")
-
-            # Compose message
-            msg = MIMEMultipart()
-            msg['Subject'] = subject
-            msg['From'] = sender
-            msg['To'] = get_env('GASDB_DATA_RECIPIENT')
-            msg.attach(MIMEText(message, "plain"))
-
-            # Add attachment
-            basename = path.basename(attachment)
-            part = MIMEBase('application', "octet-stream")
-            part.set_payload(open(attachment, "rb").read())
-            encode_base64(part)
-            part.add_header('Content-Disposition', 'attachment; filename="%s"' % basename)
-            msg.attach(part)
-
-            # Send e-mail
-            server.sendmail(sender, msg['To'].split(","), msg.as_string())
-            logger.info(f'Письмо с данными успешно отправлено {msg["To"]}')
-
-            # Clean up
-            remove(attachment)
-            logger.info("Отправленный файл был успешно удалён с диска!")
-
-        if error_list is not None and error_list.__len__() > 0:
-            error_message = MESSAGE_TEMPLATE.substitute(payload=f"При загрузке и отправке данных произошли следующие "
-                                                                f"ошибки:\n{eol.join(error_list)}")
-
-            # Compose message
-            err_msg = MIMEMultipart()
-            err_msg['Subject'] = f'Ошибки при подготовке письма "{subject}"'
-            err_msg['From'] = sender
-            err_msg['To'] = get_env('GASDB_ERROR_RECIPIENT')
-            err_msg.attach(MIMEText(error_message, "plain"))
-
-            # Send e-mail
-            server.sendmail(sender, err_msg['To'].split(","), err_msg.as_string())
-            logger.info(f'Письмо с сообщениями об ошибках успешно отправлено {err_msg["To"]}')
+    sender = get_env('GASDB_SMTP_SENDER')
+    if attachment is not None:
+        # Send e-mail
+        _send_attachment(server, attachment, subject, sender, get_env('GASDB_DATA_RECIPIENT'))
+
+        # Clean up
+        remove(attachment)
+        logger.info("Отправленный файл был успешно удалён с диска!")
+
+    if error_list is not None and error_list.__len__() > 0:
+        err_msg = compose_error_message(subject, sender, get_env('GASDB_ERROR_RECIPIENT'), error_list)
+
+        # Send e-mail
+        server.sendmail(sender, err_msg['To'].split(","), err_msg.as_string())
+        logger.info(f'Письмо с сообщениями об ошибках успешно отправлено {err_msg["To"]}')
+
+
+class MailOutbox(object):
+    """
+    Keeps one authenticated SMTP connection for the whole run and sends queued messages from a background thread.
+    In digest mode error lists are collected and sent as a single message when the outbox is closed.
+    """
+
+    _active: Optional['MailOutbox'] = None
+
+    def __init__(self, digest: bool):
+        self._digest = digest
+        self._errors: List[Tuple[str, list]] = []
+        self._errors_lock = Lock()
+        self._queue = Queue()
+        self._server: Optional[SMTP_SSL] = None
+        self._closed = False
+        self._thread = Thread(target=self._run, name='mail-outbox', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def start(cls, digest: bool) -> 'MailOutbox':
+        """
+        Creates outbox used by send_email until it is closed. It is closed on exit as well.
+        """
+        cls._active = cls(digest)
+        atexit.register(cls._active.close)
+        return cls._active
+
+    @classmethod
+    def active(cls) -> Optional['MailOutbox']:
+        return cls._active
+
+    def put(self, attachment: Optional[str], subject: str, error_list: Optional[list] = None,
+            on_sent: Optional[Callable[[], None]] = None) -> None:
+        """
+        Queues message, on_sent is called once it is sent and is never called if sending fails.
+        """
+        if self._digest and error_list is not None and len(error_list) > 0:
+            with self._errors_lock:
+                self._errors.append((subject, list(error_list)))
+            error_list = None
+        if attachment is not None or error_list:
+            self._queue.put((attachment, subject, error_list, on_sent))
+        elif on_sent is not None:
+            # Nothing to send right now
+            on_sent()
+
+    def _send(self, attachment: Optional[str], subject: str, error_list: Optional[list]) -> None:
+        if self._server is None:
+            self._server = _connect()
+        try:
+            _deliver(self._server, attachment, subject, error_list)
+        except SMTPServerDisconnected:
+            # Connection was dropped by server, e.g. due to inactivity - log in again once
+            getLogger().warning("Соединение с почтовым сервером разорвано, подключаюсь повторно.")
+            self._server = _connect()
+            _deliver(self._server, attachment, subject, error_list)
+
+    def _run(self) -> None:
+        logger = getLogger()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            attachment, subject, error_list, on_sent = item
+            try:
+                self._send(attachment, subject, error_list)
+            except Exception as err:
+                logger.error(f'Не удалось отправить письмо "{subject}": {err}')
+                self._server = None
+                continue
+            if on_sent is not None:
+                try:
+                    on_sent()
+                except Exception as err:
+                    logger.error(f'Ошибка при обработке отправленного письма "{subject}": {err}')
+
+    def close(self) -> None:
+        """
+        Waits until all queued messages are sent, sends digest of errors and logs out.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if MailOutbox._active is self:
+            MailOutbox._active = None
+        self._queue.put(None)
+        self._thread.join()
+
+        logger = getLogger()
+        try:
+            if len(self._errors) > 0:
+                if self._server is None:
+                    self._server = _connect()
+                sender = get_env('GASDB_SMTP_SENDER')
+                digest_msg = compose_digest_message(sender, get_env('GASDB_ERROR_RECIPIENT'), self._errors)
+                self._server.sendmail(sender, digest_msg['To'].split(","), digest_msg.as_string())
+                logger.info(f'Сводное письмо с сообщениями об ошибках успешно отправлено {digest_msg["To"]}')
+            if self._server is not None:
+                self._server.quit()
+        except Exception as err:
+            logger.error(f'Не удалось завершить отправку писем: {err}')
+
+
+def send_email(attachment: Optional[str], subject: str, error_list: Optional[list] = None,
+               on_sent: Optional[Callable[[], None]] = None) -> None:
+    """
+    Sends message at once or queues it to the active outbox.
+    :param on_sent: called after the message is actually sent, e.g. to mark the attached rows as delivered
+    """
+    if attachment is None and not error_list:
+        # Nothing to send, so no connection to the server is opened
+        if on_sent is not None:
+            on_sent()
+        return
+
+    outbox = MailOutbox.active()
+    if outbox is not None:
+        outbox.put(attachment, subject, error_list, on_sent)
+        return
+
+    with _connect() as server:
+        _deliver(server, attachment, subject, error_list)
+    if on_sent is not None:
+        on_sent()
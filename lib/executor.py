@@ -0,0 +1,72 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def run_concurrently(tasks: Dict[str, Callable[[], Any]],
+                     max_workers: int) -> Tuple[Dict[str, Any], Dict[str, Optional[Exception]]]:
+    """
+    Runs independent tasks in a bounded thread pool and waits for all of them.
+    Failure of one task doesn't cancel the others: the exception is caught and returned under the task name.
+    :param tasks: task name -> callable without arguments
+    :param max_workers: maximum number of tasks running at the same time
+    :return: task name -> result of the task (None if it failed) and task name -> exception raised by the task
+    (None if it succeeded)
+    """
+    logger = getLogger()
+    results = {}
+    errors = {}
+    if len(tasks) == 0:
+        return results, errors
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as pool:
+        futures = {name: pool.submit(task) for name, task in tasks.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+                errors[name] = None
+            except Exception as err:
+                logger.debug(f"Задача '{name}' завершилась с ошибкой: {err}")
+                results[name] = None
+                errors[name] = err
+    return results, errors
+
+
+def run_graph(calls: Dict[str, Tuple[Callable[..., Any], List[str]]], max_workers: int) -> Dict[str, Any]:
+    """
+    Runs calls of a dependency graph concurrently, every call starts as soon as all its dependencies are done.
+    A call receives results of its dependencies as keyword arguments named after them.
+    If a call fails no new calls are started and its exception is raised once running calls are finished.
+    :param calls: call name -> (callable, names of calls it depends on)
+    :param max_workers: maximum number of calls running at the same time
+    :return: call name -> result of the call
+    """
+    unknown = {dependency for _, dependencies in calls.values() for dependency in dependencies} - set(calls)
+    if len(unknown) > 0:
+        raise ValueError(f"Неизвестные зависимости: {', '.join(sorted(unknown))}")
+
+    results = {}
+    pending = dict(calls)
+    running = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls)))) as pool:
+        while error is None and (len(pending) > 0 or len(running) > 0):
+            for name, (func, dependencies) in list(pending.items()):
+                if all(dependency in results for dependency in dependencies):
+                    del pending[name]
+                    running[pool.submit(func, **{dependency: results[dependency]
+                                                 for dependency in dependencies})] = name
+            if len(running) == 0:
+                raise ValueError(f"Циклические зависимости: {', '.join(sorted(pending))}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as err:
+                    error = error or err
+        if error is not None:
+            wait(running)
+            raise error
+    return results
@@ -0,0 +1,49 @@
+import sqlite3
+from datetime import date, datetime
+from threading import Lock
+from typing import List, Tuple
+
+
+class JobJournal(object):
+    """
+    Durable journal of completed windows: (getter, start date, end date) -> where results were delivered.
+    Re-runs skip windows which are already in the journal.
+    """
+
+    DATE_FORMAT = '%Y-%m-%d'
+
+    def __init__(self, db_path: str):
+        self._lock = Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS completed_windows (getter TEXT NOT NULL, "
+                               "start_date TEXT NOT NULL, end_date TEXT NOT NULL, output TEXT, "
+                               "finished_at TEXT NOT NULL, PRIMARY KEY (getter, start_date, end_date))")
+
+    def record(self, getter: str, start_date: str, end_date: str, output: str) -> bool:
+        """
+        Records completed window. Windows reaching today are not recorded, since their data can still change.
+        :return: True if the window was recorded
+        """
+        if end_date >= date.today().strftime(self.DATE_FORMAT):
+            return False
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO completed_windows VALUES (?, ?, ?, ?, ?)",
+                               (getter, start_date, end_date, output, datetime.now().isoformat(timespec='seconds')))
+        return True
+
+    def completed(self, getter: str, date_start: date, date_end: date) -> List[Tuple[date, date]]:
+        """
+        Returns completed windows overlapping the range, sorted by start date.
+        Dates are of the same type as date_start: date or datetime.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT start_date, end_date FROM completed_windows WHERE getter = ? "
+                                      "AND start_date <= ? AND end_date >= ? ORDER BY start_date",
+                                      (getter, date_end.strftime(self.DATE_FORMAT),
+                                       date_start.strftime(self.DATE_FORMAT))).fetchall()
+        windows = [(datetime.strptime(start, self.DATE_FORMAT), datetime.strptime(end, self.DATE_FORMAT))
+                   for start, end in rows]
+        if isinstance(date_start, datetime):
+            return windows
+        return [(start.date(), end.date()) for start, end in windows]
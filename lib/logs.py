@@ -1,23 +1,80 @@
-from logging import getLogger, FileHandler, StreamHandler, Formatter
+import json
+from copy import copy
+from datetime import datetime
+from logging import getLogger, FileHandler, StreamHandler, Formatter, LogRecord
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
 from string import Template
 from sys import stdout
+from typing import Optional
 
 LOGS_FORMAT = '[%(asctime)s - %(levelname)s] %(module)s: %(message)s'
 
+# Listener writing records from the queue, set in queue mode only
+_listener: Optional[QueueListener] = None
+
+
+class JsonLinesFormatter(Formatter):
+    """
+    One JSON object per record, cheap to parse when analysing runs.
+    """
+
+    def format(self, record: LogRecord) -> str:
+        entry = {'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                 'level': record.levelname,
+                 'module': record.module,
+                 'thread': record.threadName,
+                 'message': record.getMessage()}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Unlike QueueHandler doesn't fold traceback into the message, formatters of the listener write it themselves.
+    """
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        record = copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Traceback is formatted in the logging thread, exception itself is not kept alive in the queue
+            record.exc_text = Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def log_init(_module_name: str, _filename: str, _debug_flag: bool, _log_level: int, log_path: str,
+             queue: bool = False, json_lines: bool = False, max_bytes: int = 0, backup_count: int = 5) -> None:
+    """
+    :param queue: records are put into a queue and written to disk by a background thread
+    :param json_lines: log file is written as JSON lines instead of text
+    :param max_bytes: size of log file to rotate it at, 0 disables rotation
+    :param backup_count: number of rotated log files to keep
+    """
+    global _listener
 
-def log_init(_module_name: str, _filename: str, _debug_flag: bool, _log_level: int, log_path: str) -> None:
     start_msg = Template(f'{_module_name} started in $mode mode!')
 
     logger = getLogger()
 
     logger.setLevel(_log_level)
+    handlers = []
 
     # Write to file by default
-    f_handler = FileHandler(f'{log_path}/{_filename}.log', encoding='utf-8')
+    f_name = f'{log_path}/{_filename}.jsonl' if json_lines else f'{log_path}/{_filename}.log'
+    if max_bytes > 0:
+        f_handler = RotatingFileHandler(f_name, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    else:
+        f_handler = FileHandler(f_name, encoding='utf-8')
     f_handler.setLevel(_log_level)
-    f_format = Formatter(LOGS_FORMAT)
+    f_format = JsonLinesFormatter() if json_lines else Formatter(LOGS_FORMAT)
     f_handler.setFormatter(f_format)
-    logger.addHandler(f_handler)
+    handlers.append(f_handler)
 
     # Output to screen in debug mode
     if _debug_flag:
@@ -25,7 +82,32 @@ def log_init(_module_name: str, _filename: str, _debug_flag: bool, _log_level: i
         c_handler.setLevel(_log_level)
         c_format = Formatter(LOGS_FORMAT)
         c_handler.setFormatter(c_format)
-        logger.addHandler(c_handler)
+        handlers.append(c_handler)
+
+    if queue:
+        # Logging threads only put records into the queue, disk and screen are written by the listener
+        records = SimpleQueue()
+        _listener = QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        q_handler = RecordQueueHandler(records)
+        q_handler.setLevel(_log_level)
+        logger.addHandler(q_handler)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    if _debug_flag:
         logger.info(start_msg.substitute(mode='debug'))
     else:
         logger.info(start_msg.substitute(mode='regular'))
+
+
+def log_stop() -> None:
+    """
+    Writes all queued records and stops the listener, does nothing if logging is not in queue mode.
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
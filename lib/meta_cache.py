@@ -0,0 +1,54 @@
+import json
+from logging import getLogger
+from os import path, replace
+from threading import Lock
+from time import time
+
+import pandas as pd
+
+
+class MetadataCache(object):
+    """
+    On-disk cache of instrument metadata keyed by RIC. Every entry expires after the configured TTL.
+    """
+
+    def __init__(self, file_path: str, ttl_hours: float, columns: list):
+        self._file_path = file_path
+        self._ttl = ttl_hours * 3600
+        self._columns = columns
+        self._lock = Lock()
+        self._entries = {}
+        if path.exists(file_path):
+            with open(file_path, encoding='utf-8') as file:
+                self._entries = json.load(file)
+
+    def stale(self, rics: list) -> list:
+        """
+        Returns RICs which are not cached yet or whose entries are older than TTL.
+        """
+        now = time()
+        with self._lock:
+            return [ric for ric in rics if ric not in self._entries or now - self._entries[ric]['ts'] > self._ttl]
+
+    def update(self, meta_df: pd.DataFrame) -> None:
+        """
+        Replaces entries for all RICs in the frame and saves the cache to disk.
+        """
+        now = time()
+        with self._lock:
+            for record in meta_df[['ric', *self._columns]].to_dict('records'):
+                ric = record.pop('ric')
+                self._entries[ric] = {'ts': now, 'values': record}
+            tmp_path = self._file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self._entries, file, ensure_ascii=False)
+            replace(tmp_path, self._file_path)
+        getLogger().debug(f"Обновлены метаданные для {len(meta_df)} RIC.")
+
+    def frame(self, rics: list) -> pd.DataFrame:
+        """
+        Returns cached metadata for given RICs in their original order, RICs without entries are skipped.
+        """
+        with self._lock:
+            records = [{'ric': ric, **self._entries[ric]['values']} for ric in rics if ric in self._entries]
+        return pd.DataFrame(records, columns=['ric', *self._columns])
@@ -0,0 +1,120 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from os import replace
+from threading import Lock
+from time import monotonic, time
+from typing import Dict, Optional, Tuple
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class RunMetrics(object):
+    """
+    Process-wide registry of stage durations and counters of a run.
+    Stages and counters are identified by name and optional labels, e.g. getter name.
+    """
+
+    PREFIX = 'eikon_loader'
+
+    _lock = Lock()
+    _started = time()
+    _stages: Dict[Key, dict] = {}
+    _counters: Dict[Key, float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> Key:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    @classmethod
+    def observe(cls, stage: str, seconds: float, **labels) -> None:
+        key = cls._key(stage, labels)
+        with cls._lock:
+            entry = cls._stages.setdefault(key, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    @classmethod
+    @contextmanager
+    def timer(cls, stage: str, **labels):
+        """
+        Measures duration of the block, it is recorded even if the block raises an exception.
+        """
+        started = monotonic()
+        try:
+            yield
+        finally:
+            cls.observe(stage, monotonic() - started, **labels)
+
+    @classmethod
+    def timed(cls, stage: str):
+        """
+        Decorator measuring duration of every call of the function.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with cls.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def add(cls, counter: str, value: float = 1, **labels) -> None:
+        key = cls._key(counter, labels)
+        with cls._lock:
+            cls._counters[key] = cls._counters.get(key, 0) + value
+
+    @classmethod
+    def report(cls) -> dict:
+        with cls._lock:
+            return {'started': datetime.fromtimestamp(cls._started).isoformat(timespec='seconds'),
+                    'finished': datetime.now().isoformat(timespec='seconds'),
+                    'duration_seconds': round(time() - cls._started, 3),
+                    'stages': [{'stage': name, 'labels': dict(labels), 'count': entry['count'],
+                                'seconds': round(entry['seconds'], 3),
+                                'max_seconds': round(entry['max_seconds'], 3)}
+                               for (name, labels), entry in sorted(cls._stages.items())],
+                    'counters': [{'counter': name, 'labels': dict(labels), 'value': value}
+                                 for (name, labels), value in sorted(cls._counters.items())]}
+
+    @classmethod
+    def _prometheus(cls, report: dict) -> str:
+        def labels_text(labels: dict) -> str:
+            if len(labels) == 0:
+                return ''
+            return '{' + ','.join(f'{label}="{value}"' for label, value in labels.items()) + '}'
+
+        lines = [f'# TYPE {cls.PREFIX}_last_run_timestamp_seconds gauge',
+                 f'{cls.PREFIX}_last_run_timestamp_seconds {time():.0f}',
+                 f'# TYPE {cls.PREFIX}_run_duration_seconds gauge',
+                 f'{cls.PREFIX}_run_duration_seconds {report["duration_seconds"]}']
+        for metric, field, metric_type in [('stage_seconds', 'seconds', 'gauge'),
+                                           ('stage_max_seconds', 'max_seconds', 'gauge'),
+                                           ('stage_count', 'count', 'gauge')]:
+            lines.append(f'# TYPE {cls.PREFIX}_{metric} {metric_type}')
+            for stage in report['stages']:
+                lines.append(f'{cls.PREFIX}_{metric}{labels_text({"stage": stage["stage"], **stage["labels"]})} '
+                             f'{stage[field]}')
+        for counter in sorted({entry['counter'] for entry in report['counters']}):
+            lines.append(f'# TYPE {cls.PREFIX}_{counter} gauge')
+            for entry in report['counters']:
+                if entry['counter'] == counter:
+                    lines.append(f'{cls.PREFIX}_{counter}{labels_text(entry["labels"])} {entry["value"]}')
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def write(cls, report_path: Optional[str], prometheus_path: Optional[str]) -> None:
+        """
+        Writes JSON run report and Prometheus textfile. Files are replaced atomically.
+        """
+        report = cls.report()
+        for file_path, content in [(report_path, lambda: json.dumps(report, ensure_ascii=False, indent=2)),
+                                   (prometheus_path, lambda: cls._prometheus(report))]:
+            if file_path is None:
+                continue
+            with open(file_path + '.tmp', 'w', encoding='utf-8') as file:
+                file.write(content())
+            replace(file_path + '.tmp', file_path)
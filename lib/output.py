@@ -0,0 +1,50 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Output format -> file extension
+OUTPUT_FORMATS = {'csv': 'csv', 'csv.gz': 'csv.gz', 'parquet': 'parquet', 'feather': 'feather'}
+COLUMNAR_FORMATS = ['parquet', 'feather']
+
+# Rows written at once, limits memory used for conversion of large frames
+CHUNK_ROWS = 100000
+
+
+def check_format(output_format: str) -> None:
+    """
+    Raises ImportError if the format requires pyarrow which is not installed.
+    """
+    if output_format in COLUMNAR_FORMATS:
+        import pyarrow  # noqa: F401
+
+
+def write_frame(frame: 'pd.DataFrame', file_path: str, output_format: str, chunk_rows: int = CHUNK_ROWS) -> str:
+    """
+    Writes frame to disk chunk by chunk in the required format.
+    :param frame: data to be saved
+    :param file_path: path without extension
+    :param output_format: one of OUTPUT_FORMATS
+    :param chunk_rows: number of rows converted and written at once
+    :return: path of the written file
+    """
+    file_path = f'{file_path}.{OUTPUT_FORMATS[output_format]}'
+    if output_format == 'csv':
+        frame.to_csv(file_path, index=False, chunksize=chunk_rows)
+    elif output_format == 'csv.gz':
+        frame.to_csv(file_path, index=False, chunksize=chunk_rows, compression={'method': 'gzip', 'mtime': 0})
+    else:
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+
+        schema = pa.Schema.from_pandas(frame, preserve_index=False)
+        if output_format == 'parquet':
+            writer = pq.ParquetWriter(file_path, schema, compression='zstd')
+        else:
+            writer = ipc.new_file(file_path, schema, options=ipc.IpcWriteOptions(compression='zstd'))
+        with writer:
+            for start in range(0, len(frame), chunk_rows):
+                writer.write_table(pa.Table.from_pandas(frame.iloc[start:start + chunk_rows], schema=schema,
+                                                        preserve_index=False))
+    return file_path
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+from threading import Lock
+from time import monotonic
+from typing import Callable, List, Optional, Tuple
+
+
+class WindowPlanner(object):
+    """
+    Splits a date range into request windows. Initial window size is derived from the number of data points
+    per day and the row limit, afterwards it grows or shrinks depending on observed latency and failures.
+    Windows never overlap completed ones, which are skipped entirely.
+    """
+
+    grow_factor = 1.5
+
+    def __init__(self, date_start, date_end, points_per_day: int, row_limit: int, target_latency: float,
+                 min_days: int = 1, max_days: int = 366, completed: Optional[List[Tuple]] = None):
+        self._lock = Lock()
+        self._completed = sorted(completed or [])
+        self._cursor = date_start
+        self._end = date_end
+        self._target_latency = target_latency
+        self._min_days = min_days
+        self._max_days = max_days
+        self._days = self._clamp(row_limit // max(1, points_per_day))
+
+    def _clamp(self, days: int) -> int:
+        return max(self._min_days, min(self._max_days, days))
+
+    @property
+    def window_days(self) -> int:
+        return self._days
+
+    def next_window(self) -> Optional[Tuple]:
+        """
+        Returns next (start, end) window or None if the whole range was already planned.
+        """
+        with self._lock:
+            for completed_start, completed_end in self._completed:
+                if completed_start <= self._cursor <= completed_end:
+                    self._cursor = completed_end + timedelta(days=1)
+            if self._cursor > self._end:
+                return None
+            window_end = min(self._cursor + timedelta(days=self._days - 1), self._end)
+            for completed_start, _ in self._completed:
+                if self._cursor < completed_start <= window_end:
+                    window_end = completed_start - timedelta(days=1)
+                    break
+            window = (self._cursor, window_end)
+            self._cursor = window_end + timedelta(days=1)
+            return window
+
+    def report(self, window: Tuple, latency: float, success: bool) -> None:
+        """
+        Adjusts size of next windows: halves it after a failure, shrinks it proportionally when the window was
+        slower than target latency and grows it when the window took less than half of the target.
+        """
+        days = (window[1] - window[0]).days + 1
+        with self._lock:
+            if not success:
+                new_days = min(self._days, days // 2)
+            elif latency > self._target_latency:
+                new_days = min(self._days, int(days * self._target_latency / latency))
+            elif latency < self._target_latency / 2 and days >= self._days:
+                new_days = int(self._days * self.grow_factor) + 1
+            else:
+                return
+            new_days = self._clamp(new_days)
+            if new_days != self._days:
+                getLogger().info(f"Размер окна выгрузки изменён с {self._days} на {new_days} дней "
+                                 f"(длительность {latency:.1f} с, успех - {success}).")
+                self._days = new_days
+
+
+def run_windows(planner: WindowPlanner, job: Callable[[Tuple], bool], workers: int) -> List[Tuple[Tuple, Exception]]:
+    """
+    Runs job for every window of the planner in a bounded pool of workers.
+    Job returns True on success, its exceptions are collected and don't stop other windows.
+    :return: list of (window, exception) for windows which raised an exception
+    """
+    errors = []
+    errors_lock = Lock()
+
+    def worker() -> None:
+        while True:
+            window = planner.next_window()
+            if window is None:
+                return
+            started = monotonic()
+            try:
+                success = job(window)
+            except Exception as err:
+                success = False
+                with errors_lock:
+                    errors.append((window, err))
+            planner.report(window, monotonic() - started, success)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for future in [pool.submit(worker) for _ in range(max(1, workers))]:
+            future.result()
+    return errors
@@ -0,0 +1,52 @@
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from typing import Optional
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket. Every call of acquire takes one token, tokens are refilled at the configured
+    rate up to the bucket capacity. Rate None disables limiting.
+    """
+
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        self._lock = Lock()
+        self._rate = rate
+        self._capacity = max(1, burst)
+        self._tokens = float(self._capacity)
+        self._updated = monotonic()
+
+    def configure(self, rate: Optional[float], burst: int = 1) -> None:
+        with self._lock:
+            self._rate = rate
+            self._capacity = max(1, burst)
+            self._tokens = min(self._tokens, self._capacity)
+
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available.
+        """
+        while True:
+            with self._lock:
+                if self._rate is None:
+                    return
+                now = monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            sleep(wait)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Exponential backoff with jitter: half of the delay is fixed, the other half is random.
+    :param attempt: number of the failed attempt starting from 1
+    :param base: delay after the first failed attempt
+    :param cap: maximum delay
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + uniform(0, delay / 2)
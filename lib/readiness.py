@@ -0,0 +1,40 @@
+import json
+from time import monotonic, sleep
+from typing import Any, Callable, Iterable, Optional
+from urllib.request import urlopen
+
+PROXY_READY = 'ST_PROXY_READY'
+
+
+def wait_until(probe: Callable[[], Any], timeout: float, interval: float) -> Any:
+    """
+    Calls probe every interval seconds until it returns a truthy value or timeout expires.
+    :return: last value returned by probe
+    """
+    deadline = monotonic() + timeout
+    while True:
+        result = probe()
+        if result or monotonic() >= deadline:
+            return result
+        sleep(max(0.0, min(interval, deadline - monotonic())))
+
+
+def proxy_status(host: str, port: int, timeout: float = 1) -> Optional[str]:
+    """
+    Returns status code reported by Eikon API Proxy on the port or None if it doesn't respond.
+    """
+    try:
+        with urlopen(f'http://{host}:{port}/api/status', timeout=timeout) as response:
+            return json.load(response).get('statusCode')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def find_ready_proxy(host: str, ports: Iterable[int], timeout: float = 1) -> Optional[int]:
+    """
+    Returns the first port where API Proxy reports it is ready or None.
+    """
+    for port in ports:
+        if proxy_status(host, port, timeout) == PROXY_READY:
+            return port
+    return None
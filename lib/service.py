@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from logging import getLogger
+from time import sleep
+from typing import Callable, Dict, List, Set
+
+from lib.email import send_email, MailSubjects
+
+
+class CronSchedule(object):
+    """
+    Cron-like schedule of five fields: minute, hour, day of month, month and day of week (0 or 7 - Sunday).
+    Every field supports '*', numbers, ranges 'a-b', lists 'a,b' and steps '*/n' or 'a-b/n'.
+    """
+
+    _LIMITS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Расписание должно состоять из 5 полей: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self._LIMITS)]
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(','):
+            value_range, _, step = part.partition('/')
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(value) for value in value_range.split('-', 1))
+            else:
+                start = end = int(value_range)
+            if start < low or end > high or start > end:
+                raise ValueError(f"Значение '{part}' вне диапазона {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_match and weekday_match
+        # As in cron, if both day fields are restricted either of them should match
+        return day_match or weekday_match
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Returns the first scheduled minute strictly after the moment.
+        """
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while current <= limit:
+            if current.month not in self.months:
+                current = (current.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+            elif current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+            elif current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+            else:
+                return current
+        raise ValueError(f"Расписание '{self.expression}' никогда не срабатывает")
+
+
+def run_service(schedules: Dict[str, CronSchedule], run_jobs: Callable[[List[str]], None],
+                is_healthy: Callable[[], bool], reconnect: Callable[[], None]) -> None:
+    """
+    Runs jobs by their schedules until interrupted. Session health is checked before every run and the session
+    is re-established only if the check fails. Runs missed while previous jobs were working are skipped.
+    :param schedules: job name -> schedule
+    :param run_jobs: runs jobs with given names
+    :param is_healthy: checks that connection to Eikon is alive
+    :param reconnect: re-establishes connection to Eikon
+    """
+    logger = getLogger()
+    next_runs = {name: schedule.next_after(datetime.now()) for name, schedule in schedules.items()}
+    while True:
+        run_time = min(next_runs.values())
+        logger.info(f"Следующий запуск {run_time:%d.%m.%Y %H:%M}: "
+                    f"{', '.join(name for name, moment in next_runs.items() if moment == run_time)}.")
+        sleep(max(0.0, (run_time - datetime.now()).total_seconds()))
+
+        due = [name for name, moment in next_runs.items() if moment <= datetime.now()]
+        if len(due) == 0:
+            continue
+        connected = True
+        if not is_healthy():
+            logger.warning("Сессия Refinitiv Eikon недоступна, подключаюсь повторно.")
+            try:
+                reconnect()
+            except Exception as err:
+                # The service keeps working, connection is attempted again before the next run
+                connected = False
+                msg = f"Не удалось подключиться к Refinitiv Eikon, задания {', '.join(due)} пропущены.\n" \
+                      f"Ошибка: {err}"
+                logger.error(msg)
+                send_email(None, MailSubjects.get_unk_err_connect_eikon(), [msg])
+        if connected:
+            try:
+                run_jobs(due)
+            except Exception as err:
+                logger.error(f"Неожиданная ошибка при выполнении заданий {', '.join(due)}: {err}")
+
+        now = datetime.now()
+        for name in due:
+            next_runs[name] = schedules[name].next_after(now)
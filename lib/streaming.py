@@ -0,0 +1,179 @@
+from datetime import datetime
+from importlib import import_module
+from logging import getLogger
+from os import path
+from threading import Event, Lock
+from time import monotonic
+from typing import Callable, Dict, Optional
+
+import eikon as ek
+import pandas as pd
+
+from lib.eikon_data_getter import GasPricesGetter
+from lib.metrics import RunMetrics
+from lib.output import write_frame
+
+OnUpdate = Callable[[str, dict], None]
+
+
+class EikonStreamingFeed(object):
+    """
+    Feed of real-time prices from Eikon streaming prices API. Requires connection to API Proxy.
+    Any object with the same subscribe and close methods can be used instead, see load_feed.
+    """
+
+    def __init__(self):
+        self._stream = None
+
+    def subscribe(self, rics: list, fields: list, on_update: OnUpdate) -> None:
+        """
+        Starts delivery of fields for the RICs, on_update is called with RIC and changed fields.
+        """
+        def callback(streaming_prices, ric: str, values: dict) -> None:
+            on_update(ric, values)
+
+        self._stream = ek.StreamingPrices(instruments=rics, fields=fields, on_refresh=callback, on_update=callback)
+        self._stream.open()
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+def load_feed(spec: str):
+    """
+    Creates price feed: 'eikon' or 'module:factory' where factory returns an object with subscribe and close methods.
+    """
+    if spec == 'eikon':
+        return EikonStreamingFeed()
+    module_name, _, factory_name = spec.partition(':')
+    if module_name == '' or factory_name == '':
+        raise ValueError(f"Источник цен должен быть 'eikon' или 'модуль:фабрика', получено '{spec}'")
+    return getattr(import_module(module_name), factory_name)()
+
+
+class PriceBook(object):
+    """
+    Latest values of every RIC. Updates are coalesced: a RIC updated many times between snapshots is written once
+    with its latest values.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values: Dict[str, dict] = {}
+        self._changed = set()
+
+    def update(self, ric: str, values: dict) -> None:
+        with self._lock:
+            self._values.setdefault(ric, {}).update(values)
+            self._values[ric]['updated'] = datetime.now()
+            self._changed.add(ric)
+
+    def take_changed(self) -> Dict[str, dict]:
+        """
+        Returns latest values of RICs changed since the previous call.
+        """
+        with self._lock:
+            changed = {ric: dict(self._values[ric]) for ric in self._changed}
+            self._changed.clear()
+        return changed
+
+
+class GasPricesStreamer(object):
+    """
+    Streaming counterpart of GasPricesGetter: subscribes to the gas RICs and periodically saves snapshots
+    of changed prices. Snapshots are upserted into the database sink of GasPricesGetter if it is configured,
+    otherwise they are written in its output format to folder_to_save, where they are kept until removed.
+    Snapshot files are not mailed.
+    """
+
+    rics = GasPricesGetter.rics
+    folder_to_save = GasPricesGetter.folder_to_save
+    file_prefix = 'stream'
+    sink_table = 'gas_prices_stream'
+    sink_key = ['snapshot', 'ric']
+    # Snapshots may be saved more often than once a second
+    save_timestamp_formatter = '%Y-%m-%dT%H-%M-%S-%f'
+    stream_fields = ['CF_LAST', 'CF_BID', 'CF_ASK', 'CF_HIGH', 'CF_LOW', 'CF_OPEN']
+    stream_columns = {'CF_LAST': 'orig_last', 'CF_BID': 'orig_bid', 'CF_ASK': 'orig_ask', 'CF_HIGH': 'orig_high',
+                      'CF_LOW': 'orig_low', 'CF_OPEN': 'orig_open'}
+
+    def __init__(self, feed, flush_interval: float):
+        self._feed = feed
+        self._flush_interval = flush_interval
+        self._book = PriceBook()
+        self._stop = Event()
+
+    def _on_update(self, ric: str, values: dict) -> None:
+        RunMetrics.add('stream_updates', getter=type(self).__name__)
+        self._book.update(ric, {field: value for field, value in values.items() if field in self.stream_columns})
+
+    def _write_sink(self, snapshot_df: pd.DataFrame) -> bool:
+        # Sink stores datetime columns as dates, snapshots of a day differ by time
+        timestamps = {column: snapshot_df[column].map(lambda moment: moment.isoformat(sep=' '))
+                      for column in ('snapshot', 'updated')}
+        try:
+            with RunMetrics.timer('sink', getter=type(self).__name__):
+                GasPricesGetter.sink.write(snapshot_df.assign(**timestamps), self.sink_table, self.sink_key)
+            return True
+        except Exception as err:
+            getLogger().error(f"Не удалось загрузить снимок цен на газ в базу данных, он будет сохранён на диск. "
+                              f"Детали: {err}")
+            return False
+
+    def flush(self) -> Optional[str]:
+        """
+        Saves changed prices to the database sink or to disk.
+        :return: table or path of the written file, None if nothing changed
+        """
+        changed = self._book.take_changed()
+        if len(changed) == 0:
+            return None
+
+        snapshot_time = datetime.now()
+        snapshot_df = pd.DataFrame.from_dict(changed, orient='index')
+        snapshot_df = snapshot_df.reindex(columns=[*self.stream_fields, 'updated'])
+        snapshot_df.index.name = 'ric'
+        snapshot_df = snapshot_df.rename(self.stream_columns, axis=1).reset_index()
+        snapshot_df.insert(0, 'snapshot', snapshot_time)
+        RunMetrics.add('stream_snapshots', getter=type(self).__name__)
+        RunMetrics.add('rows', len(snapshot_df), getter=type(self).__name__)
+        if GasPricesGetter.sink is not None and self._write_sink(snapshot_df):
+            getLogger().info(f"Снимок цен на газ по {len(snapshot_df)} RIC загружен в таблицу {self.sink_table}.")
+            return f'sink:{self.sink_table}'
+
+        with RunMetrics.timer('write', getter=type(self).__name__, format=GasPricesGetter.output_format):
+            file_path = write_frame(snapshot_df, f'{self.folder_to_save}/{self.file_prefix}_'
+                                                 f'{snapshot_time.strftime(self.save_timestamp_formatter)}',
+                                    GasPricesGetter.output_format)
+        RunMetrics.add('output_bytes', path.getsize(file_path), getter=type(self).__name__)
+        getLogger().info(f"Снимок цен на газ по {len(snapshot_df)} RIC сохранён в '{file_path}'.")
+        return file_path
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self, duration: Optional[float] = None) -> None:
+        """
+        Streams prices until stopped, interrupted or duration expires. Remaining changes are saved on exit.
+        """
+        logger = getLogger()
+        rics = list(self.rics.keys())
+        logger.info(f"Подписываюсь на цены {len(rics)} RIC, снимки сохраняются каждые {self._flush_interval} с.")
+        self._feed.subscribe(rics, self.stream_fields, self._on_update)
+        deadline = None if duration is None else monotonic() + duration
+        try:
+            while not self._stop.is_set():
+                timeout = self._flush_interval
+                if deadline is not None:
+                    timeout = min(timeout, max(0.0, deadline - monotonic()))
+                if self._stop.wait(timeout):
+                    break
+                self.flush()
+                if deadline is not None and monotonic() >= deadline:
+                    break
+        finally:
+            self._feed.close()
+            self.flush()
+            logger.info("Потоковая выгрузка цен на газ остановлена.")
@@ -0,0 +1,91 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+from logging import getLogger
+from threading import Lock
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+
+class TimeSeriesStore(object):
+    """
+    Local SQLite storage for normalized time series: (ric, date, field) -> value.
+    Keeps track of days which were already requested for every RIC, so only gaps are requested again.
+    Values requested by different calls are kept in separate tables named by prefix, since their requested days
+    are tracked separately.
+    """
+
+    DATE_FORMAT = '%Y-%m-%d'
+
+    def __init__(self, db_path: str, prefix: str = 'ts'):
+        self._values_table = f'{prefix}_values'
+        self._fetched_table = f'{prefix}_fetched'
+        self._lock = Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self._values_table} (ric TEXT NOT NULL, "
+                               f"date TEXT NOT NULL, field TEXT NOT NULL, value REAL, PRIMARY KEY (ric, date, field))")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self._fetched_table} (ric TEXT NOT NULL, "
+                               f"date TEXT NOT NULL, PRIMARY KEY (ric, date))")
+
+    @classmethod
+    def _days(cls, start_date: str, end_date: str) -> List[str]:
+        start = datetime.strptime(start_date, cls.DATE_FORMAT)
+        end = datetime.strptime(end_date, cls.DATE_FORMAT)
+        return [(start + timedelta(days=i)).strftime(cls.DATE_FORMAT) for i in range((end - start).days + 1)]
+
+    def missing_ranges(self, rics: list, start_date: str, end_date: str) -> List[Tuple[str, str, list]]:
+        """
+        Finds continuous ranges of days which were never requested.
+        :return: list of (start date, end date, RICs) where RICs share the same missing range
+        """
+        days = self._days(start_date, end_date)
+        fetched = {ric: set() for ric in rics}
+        with self._lock:
+            rows = self._conn.execute(f"SELECT ric, date FROM {self._fetched_table} WHERE date BETWEEN ? AND ? "
+                                      f"AND ric IN ({','.join('?' * len(rics))})",
+                                      [start_date, end_date, *rics]).fetchall()
+        for ric, day in rows:
+            fetched[ric].add(day)
+
+        gaps: Dict[Tuple[str, str], list] = {}
+        for ric in rics:
+            run_start = None
+            for idx, day in enumerate(days):
+                if day not in fetched[ric]:
+                    if run_start is None:
+                        run_start = day
+                    if idx == len(days) - 1 or days[idx + 1] in fetched[ric]:
+                        gaps.setdefault((run_start, day), []).append(ric)
+                        run_start = None
+        return [(gap_start, gap_end, gap_rics) for (gap_start, gap_end), gap_rics in sorted(gaps.items())]
+
+    def save(self, ts_df: pd.DataFrame, start_date: str, end_date: str) -> None:
+        """
+        Saves normalized time series and marks requested days as fetched for all RICs found in the frame.
+        Today and future days are never marked, since their values can still change.
+        """
+        values = pd.DataFrame({'ric': ts_df['Security'], 'date': ts_df['Date'].dt.strftime(self.DATE_FORMAT),
+                               'field': ts_df['Field'], 'value': ts_df['Value'].astype(float)})
+        values = values.astype(object).where(values.notna(), None)
+        today = date.today().strftime(self.DATE_FORMAT)
+        days = [day for day in self._days(start_date, end_date) if day < today]
+        with self._lock, self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO {self._values_table} VALUES (?, ?, ?, ?)",
+                                   values.itertuples(index=False, name=None))
+            self._conn.executemany(f"INSERT OR IGNORE INTO {self._fetched_table} VALUES (?, ?)",
+                                   [(ric, day) for ric in values['ric'].unique() for day in days])
+        getLogger().debug(f"В локальное хранилище сохранено {len(values)} значений.")
+
+    def load(self, rics: list, fields: list, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Loads stored time series in the same normalized form as returned by Eikon.
+        """
+        with self._lock:
+            ts_df = pd.read_sql_query(f"SELECT date AS Date, ric AS Security, field AS Field, value AS Value "
+                                      f"FROM {self._values_table} WHERE date BETWEEN ? AND ? "
+                                      f"AND ric IN ({','.join('?' * len(rics))}) "
+                                      f"AND field IN ({','.join('?' * len(fields))}) ORDER BY date, ric, field",
+                                      self._conn, params=[start_date, end_date, *rics, *fields])
+        ts_df['Date'] = pd.to_datetime(ts_df['Date'], format=self.DATE_FORMAT)
+        return ts_df
@@ -1,45 +1,117 @@
-from calendar import monthrange
+import atexit
 from datetime import date, timedelta, datetime
+from functools import partial
 from logging import ERROR, WARNING, INFO, DEBUG, getLogger
 from time import sleep
+from typing import Type, TYPE_CHECKING
 
 import click
 
-from lib.eikon_data_getter import FXRateGetter, GasPricesGetter
-from lib.eikon_desktop_handler import EikonDesktop
-from lib.email import send_email, MailSubjects
-from lib.logs import log_init
+from lib.cassette import Cassette, CASSETTE_MODES
+from lib.email import send_email, AttachmentPolicy, MailOutbox, MailSubjects
+from lib.executor import run_concurrently
+from lib.logs import log_init, log_stop
+from lib.metrics import RunMetrics
+from lib.output import OUTPUT_FORMATS, check_format
+from lib.planner import WindowPlanner, run_windows
+from lib.service import CronSchedule, run_service
 
+if TYPE_CHECKING:
+    # Modules depending on eikon, pandas and pywinauto are imported only when data is processed
+    from lib.eikon_data_getter import EikonDataGetter
 
-def get_and_send_data(date_start: datetime, date_end: datetime, fx: bool, gas: bool, type_delay: int, retry: int,
-                      retry_delay: int) -> None:
-    logger = getLogger()
+
+def send_data(getter: Type['EikonDataGetter'], date_start: datetime, date_end: datetime, retry: int,
+              retry_delay: int) -> bool:
     # Prepare dates
-    start_date = date_start.strftime(FXRateGetter.EIKON_DATE_FORMAT)
-    end_date = date_end.strftime(FXRateGetter.EIKON_DATE_FORMAT)
+    start_date = date_start.strftime(getter.EIKON_DATE_FORMAT)
+    end_date = date_end.strftime(getter.EIKON_DATE_FORMAT)
 
     if start_date == end_date:
         date_range = start_date
     else:
         date_range = start_date + ' - ' + end_date
 
-    try:
-        if fx:
-            # Get required data for fx rates
-            FXRateGetter.retrieve_data(start_date, end_date, date_range, retry, retry_delay)
-        if fx and gas:
-            # Wait if both are required
-            sleep(type_delay)
-        if gas:
-            # Get required data for gas prices
-            GasPricesGetter.retrieve_data(start_date, end_date, date_range, retry, retry_delay)
-    except Exception as err:
-        msg = f'Неожиданная ошибка при выгрузке и отправке данных.\n' \
-              f'Дата начала: {date_start:%d.%m.%Y} Дата окончания: {date_end:%d.%m.%Y}.\n' \
+    return getter.retrieve_data(start_date, end_date, date_range, retry, retry_delay)
+
+
+def load_data(getter: Type['EikonDataGetter'], date_start: datetime, date_end: datetime, retry: int, retry_delay: int,
+              window_rows: int, window_latency: float, window_workers: int) -> bool:
+    logger = getLogger()
+    # Split range into windows sized by amount of requested data and adjusted by observed latency
+    completed = None
+    if getter.journal is not None:
+        # Windows delivered by previous runs are skipped
+        completed = getter.journal.completed(getter.__name__, date_start, date_end)
+        for window_start, window_end in completed:
+            logger.info(f"Период {window_start:%d.%m.%Y} - {window_end:%d.%m.%Y} уже выгружен, пропускаю.")
+    planner = WindowPlanner(date_start, date_end, getter.points_per_day(), window_rows, window_latency,
+                            completed=completed)
+    logger.info(f"Начальный размер окна выгрузки {getter.data_name['gen']} - {planner.window_days} дней.")
+    # Failures handled by the getter are already mailed, only unexpected errors fail the load
+    errors = run_windows(planner, lambda window: send_data(getter, window[0], window[1], retry, retry_delay),
+                         window_workers)
+    for (window_start, window_end), err in errors:
+        msg = f'Неожиданная ошибка при выгрузке и отправке {getter.data_name["gen"]}.\n' \
+              f'Дата начала: {window_start:%d.%m.%Y} Дата окончания: {window_end:%d.%m.%Y}.\n' \
               f'Ошибка: {err}'
         logger.error(msg)
         send_email(None, MailSubjects.get_unk_err_load_data(), [msg])
-        exit(-1)
+    return len(errors) == 0
+
+
+def load_getters(getters: list, date_start: datetime, date_end: datetime, type_delay: int, retry: int,
+                 retry_delay: int, parallel: bool, workers: int, window_rows: int, window_latency: float,
+                 window_workers: int) -> bool:
+    logger = getLogger()
+    tasks = {getter.__name__: partial(load_data, getter, date_start, date_end, retry, retry_delay, window_rows,
+                                      window_latency, window_workers) for getter in getters}
+    if parallel:
+        # Run all required getters at once, errors are reported separately for each of them
+        results, errors = run_concurrently(tasks, workers)
+    else:
+        results, errors = {}, {}
+        for idx, getter in enumerate(getters):
+            if idx > 0:
+                # Wait if both are required
+                sleep(type_delay)
+            try:
+                results[getter.__name__] = tasks[getter.__name__]()
+                errors[getter.__name__] = None
+            except Exception as err:
+                results[getter.__name__] = None
+                errors[getter.__name__] = err
+
+    failed = False
+    for getter in getters:
+        err = errors[getter.__name__]
+        if err is not None:
+            msg = f'Неожиданная ошибка при выгрузке и отправке {getter.data_name["gen"]}.\n' \
+                  f'Дата начала: {date_start:%d.%m.%Y} Дата окончания: {date_end:%d.%m.%Y}.\n' \
+                  f'Ошибка: {err}'
+            logger.error(msg)
+            send_email(None, MailSubjects.get_unk_err_load_data(), [msg])
+        if not results[getter.__name__]:
+            failed = True
+    return not failed
+
+
+def get_and_send_data(date_start: datetime, date_end: datetime, fx: bool, gas: bool, type_delay: int, retry: int,
+                      retry_delay: int, parallel: bool, workers: int, window_rows: int, window_latency: float,
+                      window_workers: int) -> bool:
+    """
+    :return: False if any unexpected error happened
+    """
+    from lib.eikon_data_getter import FXRateGetter, GasPricesGetter
+
+    getters = []
+    if fx:
+        getters.append(FXRateGetter)
+    if gas:
+        getters.append(GasPricesGetter)
+
+    return load_getters(getters, date_start, date_end, type_delay, retry, retry_delay, parallel, workers,
+                        window_rows, window_latency, window_workers)
 
 
 @click.command(help="Выгрузка данных из Refinitiv Eikon и направление на целевой адрес эл. почты")
@@ -47,6 +119,14 @@ def get_and_send_data(date_start: datetime, date_end: datetime, fx: bool, gas: b
               help='Уровень записи логов')
 @click.option('--log-path', '-p', 'log_path', type=click.Path(exists=True), default='./logs',
               help="Путь публикации файлов журналирования")
+@click.option('--log-queue/--no-log-queue', 'log_queue', default=False,
+              help='Запись логов на диск в фоновом потоке через очередь, по умолчанию выключено')
+@click.option('--log-json/--no-log-json', 'log_json', default=False,
+              help='Запись логов в файл в формате JSON lines, по умолчанию выключено')
+@click.option('--log-max-mb', 'log_max_mb', type=click.FloatRange(min=0), default=0,
+              help='Размер файла логов в МБ, при котором он ротируется, 0 - без ротации. По умолчанию 0')
+@click.option('--log-backups', 'log_backups', type=click.IntRange(min=1), default=5,
+              help='Количество хранимых файлов логов после ротации, по умолчанию 5')
 @click.option('--get/--no-get', default=False, help='Только получение данных, без запуска и выключения терминала')
 @click.option('--fx/--no-fx', default=True, help='Получение курсов валют, по умолчанию включено')
 @click.option('--gas/--no-gas', default=True, help='Получение цен на газ, по умолчанию включено')
@@ -62,13 +142,109 @@ def get_and_send_data(date_start: datetime, date_end: datetime, fx: bool, gas: b
               type=click.DateTime(formats={'%d.%m.%Y'}), required=False, default=None)
 @click.option('--retry', '-r', help="Количество повторов при запросе данных, по умолчанию 3",
               type=click.INT, required=False, default=3)
-@click.option('--retry-delay', '-rd', help="Ожидание между повторными запросами, в секундах. По умолчанию 15 с.",
+@click.option('--retry-delay', '-rd', help="Начальное ожидание между повторными запросами, в секундах, "
+                                              "удваивается с каждой попыткой. По умолчанию 15 с.",
               type=click.INT, required=False, default=15)
 @click.option('--type-delay', '-td',
               help="Ожидание между запросами разных типов инструментов, в секундах. По умолчанию 2 с.",
               type=click.INT, required=False, default=2)
-def eikon_loader(level: str, log_path: str, get: bool, fx: bool, gas: bool, debug: bool, backoff: int,
-                 date_start: datetime, date_end: datetime, retry: int, retry_delay: int, type_delay: int) -> None:
+@click.option('--parallel/--no-parallel', default=False,
+              help='Одновременная выгрузка курсов валют и цен на газ, по умолчанию выключено')
+@click.option('--workers', '-w', help="Максимальное количество одновременных выгрузок, по умолчанию 2",
+              type=click.IntRange(min=1), required=False, default=2)
+@click.option('--chunk-size', '-cs', 'chunk_size',
+              help="Максимальное количество RIC × дней в одном запросе временных рядов, по умолчанию 3000",
+              type=click.IntRange(min=1), required=False, default=3000)
+@click.option('--chunk-workers', '-cw', 'chunk_workers',
+              help="Количество одновременных запросов временных рядов, по умолчанию 4",
+              type=click.IntRange(min=1), required=False, default=4)
+@click.option('--salvage-rounds', 'salvage_rounds',
+              help="Количество раундов повторного запроса RIC, по которым не получено ни одного значения, "
+                   "например из-за ошибки пакета. По умолчанию 2. 0 - повторяется весь запрос",
+              type=click.IntRange(min=0), required=False, default=2)
+@click.option('--cache', '-c', 'cache_path', type=click.Path(dir_okay=False), required=False, default=None,
+              help="Файл локального хранилища временных рядов и курсов валют, повторно запрашиваются только "
+                   "отсутствующие даты")
+@click.option('--meta-cache', '-mc', 'meta_cache_path', type=click.Path(dir_okay=False), required=False,
+              default=None, help="Файл кэша валют и единиц измерения инструментов")
+@click.option('--meta-ttl', '-mt', 'meta_ttl', help="Срок хранения метаданных в кэше, в часах. По умолчанию 168 ч.",
+              type=click.FloatRange(min=0), required=False, default=168)
+@click.option('--window-rows', '-wr', 'window_rows',
+              help="Начальный объём окна выгрузки, RIC × полей × дней. По умолчанию 50000",
+              type=click.IntRange(min=1), required=False, default=50000)
+@click.option('--window-latency', '-wl', 'window_latency',
+              help="Целевая длительность выгрузки одного окна, в секундах. По умолчанию 300 с.",
+              type=click.FloatRange(min=1), required=False, default=300)
+@click.option('--window-workers', '-ww', 'window_workers',
+              help="Количество одновременно выгружаемых окон для каждого типа инструментов, по умолчанию 2",
+              type=click.IntRange(min=1), required=False, default=2)
+@click.option('--rps', help="Максимальное количество запросов к Eikon API в секунду для всех выгрузок, по умолчанию 4",
+              type=click.FloatRange(min=0, min_open=True), required=False, default=4)
+@click.option('--fx-format', 'fx_format', type=click.Choice(list(OUTPUT_FORMATS)), default='csv',
+              help="Формат файла с курсами валют, по умолчанию csv")
+@click.option('--gas-format', 'gas_format', type=click.Choice(list(OUTPUT_FORMATS)), default='csv',
+              help="Формат файла с ценами на газ, по умолчанию csv")
+@click.option('--outbox/--no-outbox', default=False,
+              help='Отправка писем в фоне через одно соединение с почтовым сервером, по умолчанию выключено')
+@click.option('--digest/--no-digest', default=False,
+              help='Отправка всех ошибок одним письмом в конце работы (включает --outbox), по умолчанию выключено')
+@click.option('--max-attachment-mb', 'max_attachment_mb', type=click.FloatRange(min=0, min_open=True),
+              required=False, default=None,
+              help="Максимальный размер письма с вложением в МБ с учётом кодирования base64, файлы большего "
+                   "размера отправляются несколькими письмами")
+@click.option('--compress-attachments/--no-compress-attachments', 'compress_attachments', default=False,
+              help='Сжатие вложений gzip перед отправкой, по умолчанию выключено')
+@click.option('--service/--no-service', default=False,
+              help='Работа в режиме службы: терминал остаётся запущенным, выгрузки выполняются по расписанию. '
+                   'Дата выгрузки определяется параметром --backoff, по умолчанию - текущая дата')
+@click.option('--fx-schedule', 'fx_schedule', default='0 7 * * *',
+              help="Расписание выгрузки курсов валют в формате cron, по умолчанию '0 7 * * *'")
+@click.option('--gas-schedule', 'gas_schedule', default='0 7 * * *',
+              help="Расписание выгрузки цен на газ в формате cron, по умолчанию '0 7 * * *'")
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False), required=False, default=None,
+              help="Файл отчёта о работе в формате JSON: длительность этапов, повторы, объёмы данных")
+@click.option('--prom-file', 'prom_path', type=click.Path(dir_okay=False), required=False, default=None,
+              help="Файл метрик в текстовом формате Prometheus (для node_exporter textfile collector)")
+@click.option('--cassette', 'cassette_path', type=click.Path(file_okay=False), required=False, default=None,
+              help="Папка для записи и воспроизведения ответов Eikon API")
+@click.option('--cassette-mode', 'cassette_mode', type=click.Choice(CASSETTE_MODES), default='auto',
+              help="Режим кассеты: record - запись всех ответов, replay - только воспроизведение без терминала, "
+                   "auto - воспроизведение записанных и запись новых ответов. По умолчанию auto")
+@click.option('--stream/--no-stream', default=False,
+              help='Потоковая выгрузка цен на газ в течение дня вместо выгрузки за период, по умолчанию выключено. '
+                   'Снимки цен загружаются в базу данных (--sink), а без неё сохраняются в gas_data и не удаляются')
+@click.option('--stream-feed', 'stream_feed', default='eikon',
+              help="Источник потоковых цен: eikon или 'модуль:фабрика' для подключаемого источника. По умолчанию eikon")
+@click.option('--stream-interval', 'stream_interval', type=click.FloatRange(min=0, min_open=True), default=60,
+              help="Периодичность сохранения снимков цен, в секундах. По умолчанию 60 с.")
+@click.option('--stream-duration', 'stream_duration', type=click.FloatRange(min=0, min_open=True), required=False,
+              default=None, help="Длительность потоковой выгрузки, в секундах. По умолчанию - до остановки")
+@click.option('--sink', 'sink_url', required=False, default=None,
+              help="База данных для загрузки результатов: sqlite:///путь/к/файлу.db или "
+                   "postgresql://пользователь:пароль@хост:порт/база")
+@click.option('--mail-data/--no-mail-data', 'mail_data', default=True,
+              help='Отправка файлов с данными по почте, по умолчанию включено. Ошибки отправляются всегда')
+@click.option('--compact-dtypes/--no-compact-dtypes', 'compact_dtypes', default=False,
+              help='Компактное представление данных в памяти: даты datetime64, категориальные RIC, валюты и единицы '
+                   'измерения. По умолчанию выключено')
+@click.option('--float32/--no-float32', 'float32', default=False,
+              help='Хранение цен временных рядов в формате float32, по умолчанию выключено')
+@click.option('--delta', 'delta_path', type=click.Path(dir_okay=False), required=False, default=None,
+              help="Файл индекса отправленных строк: отправляются только новые и изменённые строки с признаком "
+                   "revision")
+@click.option('--journal', 'journal_path', type=click.Path(dir_okay=False), required=False, default=None,
+              help="Журнал выгруженных периодов: при повторном запуске уже выгруженные окна пропускаются")
+def eikon_loader(level: str, log_path: str, log_queue: bool, log_json: bool, log_max_mb: float, log_backups: int,
+                 get: bool, fx: bool, gas: bool, debug: bool, backoff: int,
+                 date_start: datetime, date_end: datetime, retry: int, retry_delay: int, type_delay: int,
+                 parallel: bool, workers: int, chunk_size: int, chunk_workers: int, salvage_rounds: int,
+                 cache_path: str, meta_cache_path: str, meta_ttl: float, window_rows: int, window_latency: float,
+                 window_workers: int, rps: float, fx_format: str, gas_format: str,
+                 outbox: bool, digest: bool, max_attachment_mb: float, compress_attachments: bool,
+                 service: bool, fx_schedule: str, gas_schedule: str, report_path: str, prom_path: str,
+                 cassette_path: str, cassette_mode: str, stream: bool, stream_feed: str, stream_interval: float,
+                 stream_duration: float, sink_url: str, mail_data: bool, compact_dtypes: bool,
+                 float32: bool, delta_path: str, journal_path: str) -> None:
     # Setting log level
     log_level = INFO
 
@@ -84,10 +260,16 @@ def eikon_loader(level: str, log_path: str, get: bool, fx: bool, gas: bool, debu
         click.BadArgumentUsage(f"Неверный уровень логгинга: {level}")
 
     # Define local logger to separate output to files on commands level
-    log_init('GasDB', 'eikon_loader', debug, log_level, log_path)
+    log_init('GasDB', 'eikon_loader', debug, log_level, log_path, log_queue, log_json, int(log_max_mb * 1024 * 1024),
+             log_backups)
+    # Registered first to run last, after everything logged on exit
+    atexit.register(log_stop)
     logger = getLogger()
 
     # Define dates range
+    if (service or stream) and backoff is None:
+        # In service and streaming modes data is loaded for the date of every run
+        backoff = 0
     if backoff is not None:
         # ignore all other params
         date_start = date.today() - timedelta(days=backoff)
@@ -107,6 +289,10 @@ def eikon_loader(level: str, log_path: str, get: bool, fx: bool, gas: bool, debu
 
     if debug:
         logger.info(f"Путь публикации файлов журналирования - {log_path}")
+        logger.info(f"Запись логов через очередь            - {log_queue}")
+        logger.info(f"Логи в формате JSON lines             - {log_json}")
+        logger.info(f"Размер файла логов для ротации        - {log_max_mb} МБ")
+        logger.info(f"Количество файлов логов после ротации - {log_backups}")
         logger.info(f"Запуск и выключение терминала         - {not get}")
         logger.info(f"Получение курсов валют                - {fx}")
         logger.info(f"Получение цен на газ                  - {gas}")
@@ -115,8 +301,137 @@ def eikon_loader(level: str, log_path: str, get: bool, fx: bool, gas: bool, debu
         logger.info(f"Количество повторов                   - {retry}")
         logger.info(f"Ожидание между повторными запросами   - {retry_delay} секунд")
         logger.info(f"Ожидание между разными запросами      - {type_delay} секунд")
+        logger.info(f"Одновременная выгрузка                - {parallel}")
+        logger.info(f"Количество одновременных выгрузок     - {workers}")
+        logger.info(f"Размер пакета временных рядов         - {chunk_size} RIC × дней")
+        logger.info(f"Одновременных запросов пакетов        - {chunk_workers}")
+        logger.info(f"Раундов дозапроса недостающих данных  - {salvage_rounds}")
+        logger.info(f"Локальное хранилище временных рядов   - {cache_path}")
+        logger.info(f"Кэш метаданных инструментов           - {meta_cache_path}")
+        logger.info(f"Срок хранения метаданных              - {meta_ttl} часов")
+        logger.info(f"Начальный объём окна выгрузки         - {window_rows} RIC × полей × дней")
+        logger.info(f"Целевая длительность выгрузки окна    - {window_latency} секунд")
+        logger.info(f"Одновременно выгружаемых окон         - {window_workers}")
+        logger.info(f"Запросов к Eikon API в секунду        - {rps}")
+        logger.info(f"Формат файла с курсами валют          - {fx_format}")
+        logger.info(f"Формат файла с ценами на газ          - {gas_format}")
+        logger.info(f"Фоновая отправка писем                - {outbox or digest}")
+        logger.info(f"Сводное письмо об ошибках             - {digest}")
+        logger.info(f"Максимальный размер письма с данными  - {max_attachment_mb} МБ")
+        logger.info(f"Сжатие вложений                       - {compress_attachments}")
+        logger.info(f"Режим службы                          - {service}")
+        logger.info(f"Расписание выгрузки курсов валют      - {fx_schedule}")
+        logger.info(f"Расписание выгрузки цен на газ        - {gas_schedule}")
+        logger.info(f"Файл отчёта о работе                  - {report_path}")
+        logger.info(f"Файл метрик Prometheus                - {prom_path}")
+        logger.info(f"Кассета ответов Eikon API             - {cassette_path}")
+        logger.info(f"Режим кассеты                         - {cassette_mode}")
+        logger.info(f"Потоковая выгрузка цен на газ         - {stream}")
+        logger.info(f"Источник потоковых цен                - {stream_feed}")
+        logger.info(f"Периодичность снимков цен             - {stream_interval} секунд")
+        logger.info(f"Длительность потоковой выгрузки       - {stream_duration} секунд")
+        logger.info(f"База данных для загрузки результатов  - {sink_url}")
+        logger.info(f"Отправка файлов с данными по почте    - {mail_data}")
+        logger.info(f"Компактные типы данных                - {compact_dtypes}")
+        logger.info(f"Цены в формате float32                - {float32}")
+        logger.info(f"Индекс отправленных строк             - {delta_path}")
+        logger.info(f"Журнал выгруженных периодов           - {journal_path}")
+
+    if report_path is not None or prom_path is not None:
+        # Written on any exit, after all e-mails are sent
+        atexit.register(RunMetrics.write, report_path, prom_path)
+
+    if not mail_data and sink_url is None:
+        logger.error("Без отправки файлов по почте должна быть указана база данных для загрузки результатов.")
+        exit(-1)
+
+    if stream and service:
+        logger.error("Потоковая выгрузка и работа по расписанию не могут быть включены одновременно.")
+        exit(-1)
+
+    schedules = {}
+    if service:
+        try:
+            if fx:
+                schedules['FXRateGetter'] = CronSchedule(fx_schedule)
+            if gas:
+                schedules['GasPricesGetter'] = CronSchedule(gas_schedule)
+        except ValueError as err:
+            logger.error(f"Неверное расписание: {err}")
+            exit(-1)
+        if len(schedules) == 0:
+            logger.error("Для работы по расписанию должна быть включена выгрузка курсов валют или цен на газ.")
+            exit(-1)
+
+    # Check output formats before any work is done
+    for output_format in {fx_format, gas_format}:
+        try:
+            check_format(output_format)
+        except ImportError as err:
+            logger.error(f"Формат {output_format} недоступен: {err}")
+            exit(-1)
+
+    # Heavy modules are loaded only after arguments are checked
+    from lib.eikon_data_getter import EikonDataGetter, FXRateGetter, GasPricesGetter
+
+    FXRateGetter.output_format = fx_format
+    GasPricesGetter.output_format = gas_format
+
+    # Configure attachments
+    if max_attachment_mb is not None:
+        AttachmentPolicy.max_size = int(max_attachment_mb * 2 ** 20)
+    AttachmentPolicy.compress = compress_attachments
+
+    if outbox or digest:
+        # All e-mails of the run are sent in background through a single connection
+        mail_outbox = MailOutbox.start(digest)
+    else:
+        mail_outbox = None
 
-    if not get:
+    # Configure batching of time series requests
+    EikonDataGetter.chunk_points = chunk_size
+    EikonDataGetter.chunk_workers = chunk_workers
+    EikonDataGetter.salvage_rounds = salvage_rounds
+    EikonDataGetter.rate_limiter.configure(rps)
+    if cache_path is not None:
+        from lib.ts_store import TimeSeriesStore
+        EikonDataGetter.ts_store = TimeSeriesStore(cache_path)
+        FXRateGetter.data_store = TimeSeriesStore(cache_path, 'fx_data')
+    if meta_cache_path is not None:
+        from lib.meta_cache import MetadataCache
+        GasPricesGetter.meta_cache = MetadataCache(meta_cache_path, meta_ttl, GasPricesGetter.meta_columns)
+    EikonDataGetter.mail_data = mail_data
+    EikonDataGetter.compact_dtypes = compact_dtypes
+    EikonDataGetter.float32_values = float32
+    if delta_path is not None:
+        from lib.delivery_index import DeliveryIndex
+        EikonDataGetter.delivery_index = DeliveryIndex(delta_path)
+    if journal_path is not None:
+        from lib.journal import JobJournal
+        EikonDataGetter.journal = JobJournal(journal_path)
+    if sink_url is not None:
+        from lib.sink import open_sink
+        try:
+            EikonDataGetter.sink = open_sink(sink_url)
+        except Exception as err:
+            logger.error(f"Не удалось подключиться к базе данных: {err}")
+            exit(-1)
+    if cassette_path is not None:
+        EikonDataGetter.cassette = Cassette(cassette_path, cassette_mode)
+    # Replayed responses and stand-in price feeds don't need the terminal
+    offline = EikonDataGetter.cassette is not None and EikonDataGetter.cassette.offline
+    if stream:
+        offline = stream_feed != 'eikon'
+        if offline:
+            logger.info(f"Цены на газ поступают из источника '{stream_feed}', терминал не используется.")
+    elif offline:
+        logger.info(f"Ответы Eikon API воспроизводятся из '{cassette_path}', терминал не используется.")
+
+    if not offline:
+        # Requires pywinauto and terminal settings, so it is not loaded when the terminal is not used
+        from lib.eikon_desktop_handler import EikonDesktop
+
+    if not get and not offline:
         # Start Refinitiv Eikon and log in
         try:
             EikonDesktop.launch()
@@ -126,28 +441,63 @@ def eikon_loader(level: str, log_path: str, get: bool, fx: bool, gas: bool, debu
             send_email(None, MailSubjects.get_unk_err_start_eikon(), [msg])
             exit(-1)
 
-    try:
-        # Connect to Refinitiv Eikon API Proxy
-        EikonDesktop.connect()
-    except Exception as err:
-        msg = f'Неожиданная ошибка при подключении к API Proxy.\nОшибка: {err}'
-        logger.error(msg)
-        send_email(None, MailSubjects.get_unk_err_connect_eikon(), [msg])
-        exit(-1)
+    if not offline:
+        try:
+            # Connect to Refinitiv Eikon API Proxy
+            EikonDesktop.connect()
+        except Exception as err:
+            msg = f'Неожиданная ошибка при подключении к API Proxy.\nОшибка: {err}'
+            logger.error(msg)
+            send_email(None, MailSubjects.get_unk_err_connect_eikon(), [msg])
+            exit(-1)
+
+    loaded = True
+    if stream:
+        from lib.streaming import GasPricesStreamer, load_feed
+        try:
+            GasPricesStreamer(load_feed(stream_feed), stream_interval).run(stream_duration)
+        except KeyboardInterrupt:
+            pass
+        except Exception as err:
+            msg = f'Неожиданная ошибка при потоковой выгрузке цен на газ.\nОшибка: {err}'
+            logger.error(msg)
+            send_email(None, MailSubjects.get_unk_err_load_data(), [msg])
+    elif service:
+        getters = {getter.__name__: getter for getter in (FXRateGetter, GasPricesGetter)}
+
+        def run_jobs(names: list) -> None:
+            job_date = date.today() - timedelta(days=backoff)
+            load_getters([getters[name] for name in names], job_date, job_date, type_delay, retry, retry_delay,
+                         parallel, workers, window_rows, window_latency, window_workers)
+            RunMetrics.write(report_path, prom_path)
 
-    if (date_end - date_start).days > 31:
-        date_end_new = date_start.replace(day=monthrange(date_start.year, date_start.month)[1])
-        while date_start <= date_end:
-            get_and_send_data(date_start, date_end_new, fx, gas, type_delay, retry, retry_delay)
-            date_start = date_end_new + timedelta(days=1)
-            date_end_new = min(date_start.replace(day=monthrange(date_start.year, date_start.month)[1]), date_end)
+        logger.info("Запускаю выгрузку по расписанию.")
+        try:
+            if offline:
+                run_service(schedules, run_jobs, lambda: True, lambda: None)
+            else:
+                run_service(schedules, run_jobs, EikonDesktop.is_healthy, partial(EikonDesktop.reconnect, not get))
+        except KeyboardInterrupt:
+            logger.info("Работа по расписанию остановлена.")
     else:
-        get_and_send_data(date_start, date_end, fx, gas, type_delay, retry, retry_delay)
+        loaded = get_and_send_data(date_start, date_end, fx, gas, type_delay, retry, retry_delay, parallel,
+                                   workers, window_rows, window_latency, window_workers)
 
-    if not get:
+    if not get and not offline:
         # Log off and shutdown Refinitiv Eikon
         EikonDesktop.close()
 
+    if EikonDataGetter.sink is not None:
+        EikonDataGetter.sink.close()
+
+    if mail_outbox is not None:
+        # Wait for all e-mails to be sent
+        mail_outbox.close()
+
+    if not loaded:
+        # Reported only after the terminal is shut down and all e-mails are sent
+        exit(-1)
+
 
 if __name__ == '__main__':
     eikon_loader()